@@ -1,59 +1,109 @@
-from flask import Flask, Markup, render_template, request, escape
+from flask import Flask, Markup, render_template, request, escape, jsonify, abort, g
 app = Flask(__name__)
 
+import instrument
 import password
 import romdata
+from lrucache import LRUCache
 from datetime import datetime
+import json
+import os
+import sys
+import time
 
-charmap_symbols = [
-    "1F", "2F", "3F", "4F", "5F", "6F", "7F", "8F", "9F", "PF", "MF", "DF", "XF",
-    "1H", "2H", "3H", "4H", "5H", "6H", "7H", "8H", "9H", "PH", "MH", "DH", "XH",
-    "1W", "2W", "3W", "4W", "5W", "6W", "7W", "8W", "9W", "PW", "MW", "DW", "XW",
-    "1E", "2E", "3E", "4E", "5E", "6E", "7E", "8E", "9E", "PE", "ME", "DE", "XE",
-    "1S", "2S", "3S", "4S", "5S", "6S", "7S", "8S", "9S", "PS", "MS", "DS", #"XS",
-]
+try:
+    import orjson
+
+    def dump_json(data):
+        return orjson.dumps(data)
+except ImportError:
+    def dump_json(data):
+        return json.dumps(data, separators=(",", ":"))
+
+charmap_symbols = password.charmap_symbols
+
+revive_team = password.encode_team("Passwd tool")
 
 charmap_html = [
     "<div class=\"pwdchar pwdchar_%s\">%s</div>" % (x[1], x[0])
     for x in charmap_symbols
 ]
 
-value_fields = {
-    "timestamp": 0xFFFFFFFF,
-    "type": 1,
-    "unk1": 1,
-    "dungeon": 0x7F,
-    "floor": 0x7F,
-    "pokemon": 0x7FF,
-    "gender": 3,
-    "reward": 3,
-    "unk2": 1,
-    "revive": 0x3FFFFFFF
-}
-
-named_fields = {
-    "dungeon": "dungeons",
-    "pokemon": "pokemon",
-    "gender": "genders",
-    "reward": "rewards"
-}
-
-def password_char2val(password):
-    code = "".join(password.split()).upper()
-    if len(code) != 30 * 2:
+value_fields = password.field_masks
+
+cache_size = int(os.environ.get("PASSWORD_CACHE_SIZE", 4096))
+cache_ttl = float(os.environ.get("PASSWORD_CACHE_TTL", 0)) or None
+cache_bytes = int(os.environ.get("PASSWORD_CACHE_BYTES", 0)) or None
+
+def entry_size(value):
+    # Roughly the memory held by an entry, along with everything in it
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(entry_size(x) for x in value.values())
+    elif isinstance(value, (list, tuple)):
+        size += sum(entry_size(x) for x in value)
+    return size
+
+# Keyed on the password's symbols, or the validated fields for encoding.
+# Revival passwords made from a rescue embed the current time, so only the
+# rescue side is cached for those.
+decode_cache = LRUCache(cache_size, cache_bytes, ttl=cache_ttl, sizeof=entry_size)
+fragment_cache = LRUCache(cache_size, cache_bytes, ttl=cache_ttl, sizeof=entry_size)
+encode_cache = LRUCache(cache_size, cache_bytes, ttl=cache_ttl, sizeof=entry_size)
+
+def decode_cached(code):
+    key = tuple(code)
+    entry = decode_cache.get(key)
+    if entry is None:
+        info = password.decode(code)
+        entry = (info, password.get_warnings(info))
+        decode_cache.put(key, entry)
+    return entry
+
+def encode_cached(info):
+    # Also primes the decode cache, as the password is shown right after
+    key = tuple(sorted((field, tuple(value) if isinstance(value, list) else value)
+            for field, value in info.items()))
+    code = encode_cache.get(key)
+    if code is None:
+        code, result = password.encode(info, with_info=True)
+        code = tuple(code)
+        encode_cache.put(key, code)
+        decode_cache.put(code, (result, password.get_warnings(result)))
+    return list(code)
+
+# Markup of every select's options, without any of them selected
+options_cache = {}
+options_version = None
+
+def render_options(name, maxval, info):
+    global options_version
+    if not romdata.loaded:
+        romdata.load()
+    if options_version != romdata.loaded:
+        options_cache.clear()
+        options_version = romdata.loaded
+
+    html = options_cache.get(name)
+    if html is None:
+        array = ()
+        if name in password.named_fields:
+            array = romdata.tables[password.named_fields[name]]
+        options = app.jinja_env.get_template("options.html").module.options
+        html = str(options(name, array, maxval, None))
+        options_cache[name] = html
+
+    if info and name in info:
+        html = html.replace("<option value=\"%d\">" % info[name],
+                "<option value=\"%d\" selected>" % info[name], 1)
+    return Markup(html)
+
+def password_char2val(password_input):
+    try:
+        return password.parse_password(password_input)
+    except ValueError:
         return None
 
-    # Convert the characters to codepoints
-    newcode = []
-    for x in range(len(code) // 2):
-        char = code[x * 2:x * 2 + 2]
-        try:
-            index = charmap_symbols.index(char)
-        except:
-            return None
-        newcode.append(index)
-    return newcode
-
 def password_val2char(code):
     password = ""
     for index, val in enumerate(code):
@@ -72,23 +122,32 @@ def password_html(code):
         html += Markup(charmap_html[code[char]])
     return html
 
-def get_warnings(info):
-    warnings = []
+def parse_info(args):
+    info = {}
+    failed = False
+    for field in value_fields:
+        if field not in args:
+            continue
 
-    if "calc_checksum" in info and "incl_checksum" in info:
-        if info["calc_checksum"] != info["incl_checksum"]:
-            warnings.append("checksum")
+        try:
+            value = args[field]
+            if not isinstance(value, int):
+                value = int(value, 0)
+        except:
+            failed = True
+            continue
 
-    if info["type"] == 0:
-        for field, array in named_fields.items():
-            if not romdata.get_index(array, info[field])["valid"]:
-                warnings.append(field)
-        
-        dungeon = romdata.get_index("dungeons", info["dungeon"])
-        if info["floor"] == 0 or info["floor"] > dungeon["floors"]:
-            warnings.append("floor")
+        if value < 0 or value > value_fields[field]:
+            failed = True
+            continue
+        info[field] = value
+    if "team" in args:
+        try:
+            info["team"] = password.encode_team(args["team"])
+        except (TypeError, ValueError):
+            failed = True
 
-    return warnings
+    return info, failed
 
 def validate_info(info):
     if "timestamp" not in info or "type" not in info or "team" not in info:
@@ -122,16 +181,22 @@ def render_password(code, revive=False, password_input=None, info=None, **kwargs
     password_revive = None
 
     if code:
-        info = password.decode(code)
-        info_text = escape(password.print_info(info))
-        warnings = get_warnings(info)
-        password_input = escape(password_val2char(code))
-        password_output = escape(password_html(code))
+        info, warnings = decode_cached(code)
+        info = dict(info)
+
+        fragments = fragment_cache.get(tuple(code))
+        if fragments is None:
+            fragments = (escape(password.print_info(info)),
+                    escape(password_val2char(code)),
+                    escape(password_html(code)))
+            fragment_cache.put(tuple(code), fragments)
+        info_text, password_input, password_output = fragments
+
         if info["type"] == 0 and revive:
             inforev = {
                 "timestamp": int(datetime.now().timestamp()),
                 "unk1": 0,
-                "team": [romdata.charmap_text.index(x) for x in "Passwd tool"],
+                "team": revive_team,
                 "type": 1,
                 "revive": info["revive"]
             }
@@ -147,15 +212,7 @@ def render_password(code, revive=False, password_input=None, info=None, **kwargs
 
     for info in (infores, inforev):
         if "team" in info:
-            team = ""
-            for char in info["team"]:
-                if char == 0:
-                    break
-                if char < 402:
-                    team += romdata.charmap_text[char]
-                else:
-                    team += "★"
-            info["team"] = team
+            info["team"] = password.decode_team(info["team"])
 
         if "timestamp" not in info:
             info["timestamp"] = int(datetime.now().timestamp())
@@ -163,8 +220,7 @@ def render_password(code, revive=False, password_input=None, info=None, **kwargs
             info["team"] = "Passwd tool"
 
     return render_template("index.html",
-            romdata=romdata.romdata,
-            named=named_fields,
+            options=render_options,
             value=value_fields,
 
             infores=infores,
@@ -176,6 +232,48 @@ def render_password(code, revive=False, password_input=None, info=None, **kwargs
             password_revive=password_revive,
             **kwargs)
 
+# Timed when instrumentation is enabled
+instrument.instrument(globals(), [
+    "password_char2val", "password_val2char", "password_html", "decode_cached",
+    "encode_cached", "render_options", "render_password", "render_template"
+], prefix="app.")
+
+if instrument.enabled:
+    @app.before_request
+    def start_request():
+        g.request_start = time.perf_counter()
+        if instrument.profiler:
+            g.request_profile = instrument.profiler.start()
+
+    @app.teardown_request
+    def finish_request(exception):
+        if "request_start" not in g:
+            return
+        if instrument.profiler:
+            instrument.profiler.stop(g.request_profile)
+        endpoint = request.endpoint or "none"
+        instrument.count("password_requests_total", endpoint=endpoint)
+        instrument.count("password_request_seconds_total",
+                time.perf_counter() - g.request_start, endpoint=endpoint)
+
+@app.route("/metrics")
+def metrics():
+    extra = [("password_options_cache_entries", "gauge", {}, len(options_cache))]
+    for name, cache in (("decode", decode_cache), ("fragment", fragment_cache), ("encode", encode_cache)):
+        for stat, value in cache.stats().items():
+            type = "gauge" if stat in ("entries", "bytes") else "counter"
+            if type == "counter":
+                stat += "_total"
+            extra.append(("password_cache_" + stat, type, {"cache": name}, value))
+    return app.response_class(instrument.metrics(extra),
+            mimetype="text/plain; version=0.0.4")
+
+@app.route("/metrics/profile")
+def metrics_profile():
+    if not instrument.profiler:
+        abort(404)
+    return app.response_class(instrument.report(), mimetype="text/plain")
+
 @app.route("/")
 def index():
     return render_password(None)
@@ -204,38 +302,78 @@ def encode():
     code = None
     encode_failed = False
 
-    info = {}
-    for field in value_fields:
-        if field not in request.args:
-            continue
-
-        try:
-            value = int(request.args.get(field), 0)
-        except:
-            encode_failed = True
-            continue
-
-        if value < 0 or value > value_fields[field]:
-            encode_failed = True
-            continue
-        info[field] = value
-    if "team" in request.args:
-        team = request.args.get("team")
-        if len(team) > 12:
-            encode_failed = True
-        else:
-            info["team"] = []
-            for char in team:
-                if char in romdata.charmap_text:
-                    info["team"].append(romdata.charmap_text.index(char))
-                else:
-                    encode_failed = True
-                    break
-
+    info, encode_failed = parse_info(request.args)
     if not encode_failed:
         if validate_info(info):
-            code = password.encode(info)
+            code = encode_cached(info)
         else:
             encode_failed=True
 
     return render_password(code, info=info, encode_failed=encode_failed)
+
+@app.route("/api/decode", methods=["POST"])
+def api_decode():
+    passwords = request.get_json(silent=True)
+    if not isinstance(passwords, list):
+        abort(400)
+
+    codes = []
+    for password_input in passwords:
+        if not isinstance(password_input, str):
+            abort(400)
+        codes.append(password_char2val(password_input))
+
+    results = []
+    for code in codes:
+        if not code:
+            results.append(None)
+            continue
+        results.append(api_result(code, *decode_cached(code)))
+
+    return jsonify(results)
+
+def api_result(code, info, warnings):
+    return {
+        "password": password.format_password(code),
+        "info": info,
+        "warnings": warnings
+    }
+
+def api_response(result, status=200):
+    return app.response_class(dump_json(result), status=status,
+            mimetype="application/json")
+
+@app.route("/api/v1/decode", methods=["GET", "POST"])
+def api_v1_decode():
+    if request.is_json:
+        # Either the password itself, or an object like the query string
+        password_input = request.get_json(silent=True)
+        if isinstance(password_input, dict):
+            password_input = password_input.get("c")
+    else:
+        password_input = request.values.get("c")
+    if not isinstance(password_input, str):
+        return api_response({"error": "Missing password"}, 400)
+
+    try:
+        code = password.parse_password(password_input)
+    except ValueError as e:
+        return api_response({"error": str(e)}, 400)
+
+    return api_response(api_result(code, *decode_cached(code)))
+
+@app.route("/api/v1/encode", methods=["GET", "POST"])
+def api_v1_encode():
+    if request.is_json:
+        args = request.get_json(silent=True)
+        if not isinstance(args, dict):
+            return api_response({"error": "Expected a json object"}, 400)
+    else:
+        args = request.values
+
+    info, failed = parse_info(args)
+    if failed or not validate_info(info):
+        return api_response({"error": "Invalid or missing fields"}, 400)
+
+    code = encode_cached(info)
+    return api_response(api_result(code, *decode_cached(code)))
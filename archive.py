@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Decode large files of passwords with bounded memory. Passwords may be split
+# over multiple lines and contain whitespace, like password_val2char() in
+# app.py formats them. Lines that aren't made of password symbols are skipped.
+# Passwords are decoded in chunks, all at once with numpy if it's installed.
+
+from sys import stderr, stdout, exit
+import json
+import mmap
+import os
+import password
+
+try:
+    from password_numpy import decode_many
+except ImportError:
+    from password import decode_many
+
+def read_lines(filename, use_mmap=False):
+    if filename == "-":
+        from sys import stdin
+        yield from stdin
+        return
+
+    if not use_mmap or os.path.getsize(filename) == 0:
+        with open(filename, errors="replace") as f:
+            yield from f
+        return
+
+    with open(filename, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            for line in iter(m.readline, b""):
+                yield line.decode(errors="replace")
+
+def find_passwords(lines):
+    # Yields (line number, code), or (line number, None) for skipped lines
+    code = []
+    start = None
+    for number, line in enumerate(lines, 1):
+        line = "".join(line.split()).upper()
+        if not line:
+            continue
+
+        symbols = []
+        for x in range(0, len(line) - 1, 2):
+            symbol = password.charmap_symbols_index.get(line[x:x + 2])
+            if symbol is None:
+                break
+            symbols.append(symbol)
+        if len(line) % 2 or len(symbols) != len(line) // 2:
+            code = []
+            yield number, None
+            continue
+
+        # A password that's too short to be continued by this line is dropped,
+        # instead of throwing off every password after it
+        if code and len(code) + len(symbols) > 30:
+            yield start, None
+            code = []
+        if not code:
+            start = number
+
+        code += symbols
+        while len(code) >= 30:
+            yield number, code[:30]
+            code = code[30:]
+
+    if code:
+        yield start, None
+
+def chunked(iterable, size):
+    chunk = []
+    for x in iterable:
+        chunk.append(x)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def decode_archive(lines, chunk_size=1024):
+    # Yields (line number, code, info), with no code or info for skipped lines
+    for chunk in chunked(find_passwords(lines), chunk_size):
+        codes = [code for number, code in chunk if code]
+        infos = iter(decode_many(codes))
+        for number, code in chunk:
+            if not code:
+                yield number, None, None
+                continue
+            yield number, code, next(infos)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-m", "--mmap", action="store_true", help="read the file through mmap")
+    parser.add_argument("-c", "--chunk-size", type=int, default=1024)
+    parser.add_argument("-o", "--output", help="file to write the decoded passwords to, as json lines")
+    parser.add_argument("--columnar", help="write the decoded passwords to this file in the format of columnar.py instead")
+    parser.add_argument("file", help="file to read, or - for stdin")
+    args = parser.parse_args()
+
+    writer = None
+    output = stdout
+    if args.columnar:
+        import columnar
+        writer = columnar.ColumnWriter(args.columnar)
+    elif args.output:
+        output = open(args.output, "w")
+
+    decoded = 0
+    skipped = 0
+    lines = read_lines(args.file, use_mmap=args.mmap)
+    for number, code, info in decode_archive(lines, chunk_size=args.chunk_size):
+        if not code:
+            skipped += 1
+            continue
+        if writer:
+            writer.add(info, line=number)
+        else:
+            output.write(json.dumps({"line": number, "password": password.format_password(code), "info": info}) + "\n")
+        decoded += 1
+
+    if writer:
+        writer.close()
+    output.close()
+
+    print("Decoded %d passwords, skipped %d lines" % (decoded, skipped), file=stderr)
+    if not decoded:
+        exit(1)
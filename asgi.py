@@ -0,0 +1,124 @@
+# ASGI entry point for the web app, which can be served with any ASGI server:
+#
+#   uvicorn asgi:app
+#
+# Identical requests that arrive while one is already being handled share its
+# result, and the actual work is done by a bounded pool of worker processes.
+
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+workers = int(os.environ.get("PASSWORD_WORKERS", os.cpu_count()))
+max_pending = int(os.environ.get("PASSWORD_MAX_PENDING", workers * 4))
+
+def handle(method, path, query_string, body, content_type):
+    # Runs in the worker processes
+    import app
+    with app.app.test_request_context(path, method=method,
+            query_string=query_string, data=body, content_type=content_type):
+        response = app.app.full_dispatch_request()
+        headers = [(key.encode("latin-1"), value.encode("latin-1"))
+                for key, value in response.headers.items()]
+        return response.status_code, headers, response.get_data()
+
+class Coalescer():
+    def __init__(self, executor, max_pending):
+        self.executor = executor
+        self.semaphore = asyncio.Semaphore(max_pending)
+        self.inflight = {}
+        self.requests = 0
+        self.coalesced = 0
+        self.queued = 0
+        self.running = 0
+
+    async def compute(self, func, *args):
+        self.queued += 1
+        async with self.semaphore:
+            self.queued -= 1
+            self.running += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, func, *args)
+            finally:
+                self.running -= 1
+
+    async def run(self, key, func, *args):
+        self.requests += 1
+        future = self.inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.compute(func, *args))
+            self.inflight[key] = future
+            future.add_done_callback(lambda x: self.inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        # Don't let a cancelled request cancel the others waiting on it
+        return await asyncio.shield(future)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "hit_rate": self.coalesced / self.requests if self.requests else 0,
+            "inflight": len(self.inflight),
+            "queued": self.queued,
+            "running": self.running
+        }
+
+coalescer = None
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+async def send_response(send, status, headers, body):
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+async def lifespan(receive, send):
+    global coalescer
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            coalescer = Coalescer(ProcessPoolExecutor(workers), max_pending)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            coalescer.executor.shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    global coalescer
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    # Servers without lifespan support
+    if coalescer is None:
+        coalescer = Coalescer(ProcessPoolExecutor(workers), max_pending)
+
+    if scope["path"] == "/stats":
+        body = json.dumps(coalescer.stats()).encode()
+        return await send_response(send, 200,
+                [(b"content-type", b"application/json")], body)
+
+    body = await read_body(receive)
+    content_type = None
+    for key, value in scope["headers"]:
+        if key == b"content-type":
+            content_type = value.decode("latin-1")
+
+    method = scope["method"]
+    path = scope["path"]
+    query_string = scope["query_string"]
+    key = (method, path, query_string, body, content_type)
+    status, headers, body = await coalescer.run(key, handle,
+            method, path, query_string, body, content_type)
+    await send_response(send, status, headers, body)
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+# Benchmarks for the password codec
+
+from sys import stderr, exit
+import json
+import os
+import random
+import time
+import tracemalloc
+import password
+
+def random_codes(count, seed=0):
+    rand = random.Random(seed)
+    return [[rand.randrange(len(password.charmap_symbols)) for x in range(30)]
+            for x in range(count)]
+
+def random_infos(count, type, seed=0):
+    rand = random.Random(seed)
+    infos = []
+    for x in range(count):
+        info = {
+            "timestamp": rand.getrandbits(32),
+            "type": type,
+            "unk1": 0,
+            "team": [rand.randrange(1, 402) for x in range(rand.randrange(1, 13))],
+        }
+        if type == 0:
+            info["dungeon"] = rand.randrange(1, 100)
+            info["floor"] = rand.randrange(1, 100)
+            info["pokemon"] = rand.randrange(1, 1007)
+            info["gender"] = rand.randrange(2)
+            info["reward"] = rand.randrange(3)
+            info["unk2"] = 0
+        else:
+            info["revive"] = rand.getrandbits(30)
+        infos.append(info)
+    return infos
+
+def bench(func, args, alloc_count=100):
+    times = []
+    results = []
+    for x in args:
+        start = time.perf_counter_ns()
+        results.append(func(*x))
+        times.append(time.perf_counter_ns() - start)
+
+    # Peak memory allocated while running the function, in bytes
+    tracemalloc.start()
+    alloc = 0
+    for x in args[:alloc_count]:
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        func(*x)
+        alloc = max(alloc, tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    times.sort()
+    stats = {
+        "ops": len(times) * 1e9 / sum(times),
+        "p50": times[len(times) // 2] / 1000,
+        "p99": times[len(times) * 99 // 100] / 1000,
+        "alloc": alloc
+    }
+    return results, stats
+
+def bench_engines(name, func, engines, set_engine, default, codes):
+    # Every engine must produce exactly the same values as the original one
+    args = [(x,) for x in codes]
+    results = {}
+    reference = None
+    for engine in engines:
+        set_engine(engine)
+        values, results["%s (%s)" % (name, engine)] = bench(func, args)
+        if reference is None:
+            reference = values
+        elif values != reference:
+            print("%s engine %s doesn't match" % (name, engine), file=stderr)
+            exit(1)
+    set_engine(default)
+    return results
+
+def bench_stages(codes):
+    results = {}
+
+    shuffled, results["apply_shuffle"] = bench(password.apply_shuffle, [(x,) for x in codes])
+    packed, results["apply_bitpack"] = bench(password.apply_bitpack, [(x, 6, 8) for x in shuffled])
+
+    seeds = [(x[0] | x[1] << 8,) for x in packed]
+    _, results["NumberGenerator"] = bench(password.NumberGenerator, seeds)
+    password.make_keystream.cache_clear()
+    _, results["apply_crypto (cold)"] = bench(password.apply_crypto, [(x,) for x in packed])
+    decrypted, results["apply_crypto"] = bench(password.apply_crypto, [(x,) for x in packed])
+
+    _, results["checksum"] = bench(password.checksum, [(x[1:],) for x in decrypted])
+    results.update(bench_engines("crc32", password.charcode_crc32, password.crc32_engines,
+            password.set_crc32_engine, password.crc32_engine, codes))
+    results.update(bench_engines("decode", password.decode, password.decode_engines,
+            password.set_decode_engine, password.decode_engine, codes))
+    return results
+
+def bench_cold(func, args):
+    # Starts without any cached keystreams, instead of reusing the ones made
+    # by whatever ran before
+    password.make_keystream.cache_clear()
+    return bench(func, args)
+
+def bench_codec(count):
+    results = {}
+    for type, name in ((0, "rescue"), (1, "revival")):
+        infos = random_infos(count, type)
+        codes, results["encode (%s)" % name] = bench_cold(password.encode, [(x,) for x in infos])
+        _, results["decode (%s)" % name] = bench_cold(password.decode, [(x,) for x in codes])
+
+        # What encoding with the info saves over decoding the result again
+        _, results["encode+decode (%s)" % name] = bench_cold(
+                lambda x: password.decode(password.encode(x)), [(x,) for x in infos])
+        _, results["encode+info (%s)" % name] = bench_cold(
+                lambda x: password.encode(x, with_info=True), [(x,) for x in infos])
+    return results
+
+def print_savings(results):
+    for name in ("rescue", "revival"):
+        before = results.get("encode+decode (%s)" % name)
+        after = results.get("encode+info (%s)" % name)
+        if not before or not after:
+            continue
+        saved = 1e6 / before["ops"] - 1e6 / after["ops"]
+        print("Encoding %s passwords with their info saves %.1fus (%.0f%%) over decoding them again" % (
+                name, saved, saved * before["ops"] / 1e6 * 100))
+
+def bench_app(count):
+    try:
+        import app
+    except ImportError:
+        print("Flask isn't available, skipping the web app", file=stderr)
+        return {}
+
+    client = app.app.test_client()
+    infos = random_infos(count, 0)
+    passwords = [password.format_password(password.encode(x)) for x in infos]
+    encode_urls = ["/encode?" + "&".join("%s=%s" % (key, value)
+            for key, value in x.items() if key != "team") for x in infos]
+
+    results = {}
+    _, results["GET /"] = bench(client.get, [("/",)] * count)
+    _, results["GET /decode"] = bench(client.get, [("/decode?c=" + x,) for x in passwords])
+    _, results["GET /decode (revival)"] = bench(client.get, [("/decode?r=1&c=" + x,) for x in passwords])
+    _, results["GET /encode"] = bench(client.get, [(x + "&team=",) for x in encode_urls])
+    _, results["GET /api/v1/decode"] = bench(client.get, [("/api/v1/decode?c=" + x,) for x in passwords])
+    return results
+
+def bench_memory(workers, count, keystream_file=None):
+    # Memory used by every worker decoding passwords, with each of them having
+    # its own tables, and with the tables shared by the process forking them
+    import server
+    if server.memory_usage(os.getpid()) is None:
+        print("Memory usage isn't available, skipping the memory report", file=stderr)
+        return {}
+
+    codes = random_codes(count)
+    results = {}
+    for shared in (False, True):
+        result_read, result_write = os.pipe()
+        pid = os.fork()
+        if pid:
+            os.close(result_write)
+            with os.fdopen(result_read) as f:
+                results["shared tables" if shared else "own tables"] = json.load(f)
+            os.waitpid(pid, 0)
+            continue
+
+        os.close(result_read)
+        if shared:
+            if not keystream_file:
+                print("Generating the keystream table, use --keystream-file to generate it only once", file=stderr)
+            password.share_tables(keystream_file)
+        else:
+            # Each worker has to make its own keystreams, not inherit ours
+            password.make_keystream.cache_clear()
+
+        # Workers wait until all of them are measured
+        done_read, done_write = os.pipe()
+        hold_read, hold_write = os.pipe()
+        pids = []
+        for x in range(workers):
+            worker = os.fork()
+            if worker == 0:
+                os.close(hold_write)
+                for code in codes:
+                    password.decode(code)
+                os.write(done_write, b"x")
+                os.read(hold_read, 1)
+                os._exit(0)
+            pids.append(worker)
+
+        done = 0
+        while done < workers:
+            done += len(os.read(done_read, workers))
+        usages = [server.memory_usage(x) for x in pids]
+        os.close(hold_write)
+        for worker in pids:
+            os.waitpid(worker, 0)
+
+        average = {key: sum(x[key] for x in usages) / workers for key in usages[0]}
+        os.write(result_write, json.dumps(average).encode())
+        os._exit(0)
+    return results
+
+def print_memory(results):
+    if not results:
+        return
+    print("%-24s %10s %10s %10s" % ("memory per worker", "rss kB", "pss kB", "private kB"))
+    for name, usage in results.items():
+        print("%-24s %10d %10d %10d" % (name, usage["rss"], usage["pss"], usage["private"]))
+
+def print_results(results, baseline=None, threshold=None):
+    regressions = []
+    for name, stats in results.items():
+        line = "%-24s %10d ops/s  p50 %8.1fus  p99 %8.1fus  alloc %7d B" % (
+                name, stats["ops"], stats["p50"], stats["p99"], stats["alloc"])
+        if baseline and name in baseline:
+            change = stats["ops"] / baseline[name]["ops"] - 1
+            line += "  %+6.1f%%" % (change * 100)
+            if threshold is not None and change < -threshold:
+                line += " (!)"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--count", type=int, default=10000)
+    parser.add_argument("--app-count", type=int, default=200)
+    parser.add_argument("--no-app", action="store_true", help="don't benchmark the web app")
+    parser.add_argument("--memory", type=int, metavar="WORKERS",
+            help="also compare the memory used by this many forked workers with and without shared tables")
+    parser.add_argument("--keystream-file", help="keystream table to share with --memory, generated if it doesn't exist")
+    parser.add_argument("-o", "--output", help="write the results as json to this file")
+    parser.add_argument("-c", "--compare", help="compare against results saved with --output")
+    parser.add_argument("-t", "--threshold", type=float, default=0.1,
+            help="slowdown relative to the baseline that counts as a regression")
+    args = parser.parse_args()
+
+    codes = random_codes(args.count)
+    results = {}
+    results.update(bench_stages(codes))
+    results.update(bench_codec(args.count))
+    if not args.no_app:
+        results.update(bench_app(args.app_count))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    regressions = print_results(results, baseline, args.threshold)
+    print_savings(results)
+    if args.memory:
+        print_memory(bench_memory(args.memory, args.count, args.keystream_file))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"count": args.count, "results": results}, f, indent=4)
+
+    if regressions:
+        print("Regressions: %s" % ", ".join(regressions), file=stderr)
+        exit(1)
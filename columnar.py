@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+# Compact columnar file format for decoded passwords. The file starts with a
+# header describing every column, followed by the data of each column as a
+# little-endian array, so it can be mapped into memory and used directly.
+#
+# Header:  magic, version, column count, row count
+# Columns: name, array typecode, values per row, data offset
+
+from array import array
+from sys import byteorder, stderr, exit
+import mmap
+import struct
+import tempfile
+import password
+
+magic = b"PWDCOLS\0"
+version = 2
+header_format = "<8sHHQ"
+column_format = "<16scHQ"
+
+def field_typecode(bits):
+    if bits <= 8:
+        return "B"
+    if bits <= 16:
+        return "H"
+    return "I"
+
+# (name, typecode, values per row) of every column
+columns = [("line", "I", 1)]
+for layout in password.layouts.values():
+    for name, offset, bits, count in layout.fields:
+        if name not in [x[0] for x in columns]:
+            columns.append((name, field_typecode(bits), count))
+columns.append(("checksum_ok", "B", 1))
+
+class ColumnWriter():
+    def __init__(self, filename, buffer_rows=4096):
+        self.filename = filename
+        self.buffer_rows = buffer_rows
+        self.rows = 0
+
+        # Every column is spilled to its own temporary file until the end
+        self.files = [tempfile.TemporaryFile() for x in columns]
+        self.buffers = [array(typecode) for name, typecode, count in columns]
+
+    def add(self, info, line=0):
+        # The line of the input the password was read from, if any
+        for (name, typecode, count), buffer in zip(columns, self.buffers):
+            if name == "line":
+                buffer.append(line)
+            elif name == "checksum_ok":
+                buffer.append(info["incl_checksum"] == info["calc_checksum"])
+            elif count > 1:
+                values = list(info.get(name, ()))[:count]
+                buffer.extend(values + [0] * (count - len(values)))
+            else:
+                buffer.append(info.get(name, 0))
+
+        self.rows += 1
+        if self.rows % self.buffer_rows == 0:
+            self.flush()
+
+    def flush(self):
+        for f, buffer in zip(self.files, self.buffers):
+            if byteorder != "little":
+                buffer.byteswap()
+            buffer.tofile(f)
+            del buffer[:]
+
+    def close(self):
+        self.flush()
+
+        # Data starts after the header, with every column aligned to 8 bytes
+        offset = struct.calcsize(header_format) + struct.calcsize(column_format) * len(columns)
+        offsets = []
+        for f in self.files:
+            offset = (offset + 7) & ~7
+            offsets.append(offset)
+            offset += f.tell()
+
+        with open(self.filename, "wb") as out:
+            out.write(struct.pack(header_format, magic, version, len(columns), self.rows))
+            for (name, typecode, count), offset in zip(columns, offsets):
+                out.write(struct.pack(column_format, name.encode(), typecode.encode(), count, offset))
+            for f, offset in zip(self.files, offsets):
+                out.write(b"\0" * (offset - out.tell()))
+                f.seek(0)
+                while True:
+                    data = f.read(1 << 20)
+                    if not data:
+                        break
+                    out.write(data)
+                f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+def read_columns(filename):
+    # Returns the row count and a memoryview of every column, which
+    # stays valid for as long as the views are referenced
+    with open(filename, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    file_magic, file_version, count, rows = struct.unpack_from(header_format, data)
+    if file_magic != magic or file_version != version:
+        raise ValueError("Not a password column file")
+    if byteorder != "little":
+        raise ValueError("Column files can only be mapped on little-endian machines")
+
+    view = memoryview(data)
+    result = {}
+    offset = struct.calcsize(header_format)
+    for x in range(count):
+        name, typecode, width, start = struct.unpack_from(column_format, data, offset)
+        offset += struct.calcsize(column_format)
+        typecode = typecode.decode()
+        size = array(typecode).itemsize * width * rows
+        result[name.rstrip(b"\0").decode()] = view[start:start + size].cast(typecode)
+    return rows, result
+
+def write_parquet(filename, output):
+    # Requires pyarrow
+    import pyarrow
+    import pyarrow.parquet
+
+    types = {"B": pyarrow.uint8(), "H": pyarrow.uint16(), "I": pyarrow.uint32()}
+    rows, data = read_columns(filename)
+    arrays = []
+    for name, typecode, count in columns:
+        values = pyarrow.Array.from_buffers(types[typecode], rows * count,
+                [None, pyarrow.py_buffer(data[name])])
+        if count > 1:
+            values = pyarrow.FixedSizeListArray.from_arrays(values, count)
+        arrays.append(values)
+    table = pyarrow.Table.from_arrays(arrays, names=[x[0] for x in columns])
+    pyarrow.parquet.write_table(table, output)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--parquet", help="convert the file to parquet (requires pyarrow)")
+    parser.add_argument("file")
+    args = parser.parse_args()
+
+    if args.parquet:
+        try:
+            write_parquet(args.file, args.parquet)
+        except ImportError:
+            print("Writing parquet files requires pyarrow", file=stderr)
+            exit(1)
+        exit(0)
+
+    rows, data = read_columns(args.file)
+    print("Rows: %d" % rows)
+    for name, values in data.items():
+        print("%s: %s x %d" % (name, values.format, len(values) // rows if rows else 0))
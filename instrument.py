@@ -0,0 +1,209 @@
+# Opt-in instrumentation of the password tools: per-stage timers, counters,
+# and profiling through cProfile or by sampling stacks. Functions are only
+# wrapped once this is enabled, so it costs nothing otherwise.
+#
+#   PASSWORD_METRICS=1          time every instrumented stage
+#   PASSWORD_PROFILE=cprofile   also profile with cProfile
+#   PASSWORD_PROFILE=sample     also profile by sampling the stack periodically
+
+from functools import wraps
+import io
+import os
+import sys
+import threading
+import time
+
+profile_modes = ["cprofile", "sample"]
+
+lock = threading.Lock()
+
+# Calls and total seconds of every stage
+stages = {}
+
+# Keyed on (name, labels)
+counters = {}
+
+enabled = False
+profile_mode = None
+profiler = None
+
+class CProfiler():
+    def __init__(self):
+        self.stats = None
+
+    def start(self):
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another thread is already being profiled
+            return None
+        return profile
+
+    def stop(self, profile):
+        if profile is None:
+            return
+        profile.disable()
+
+        import pstats
+        with lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+
+    def report(self, limit=30):
+        if self.stats is None:
+            return "No profile data\n"
+        output = io.StringIO()
+        with lock:
+            self.stats.stream = output
+            self.stats.sort_stats("cumulative").print_stats(limit)
+        return output.getvalue()
+
+class Sampler():
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.threads = {}
+        self.samples = 0
+        self.own = {}
+        self.total = {}
+        self.thread = None
+
+    def start(self):
+        ident = threading.get_ident()
+        with lock:
+            self.threads[ident] = self.threads.get(ident, 0) + 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        return ident
+
+    def stop(self, ident):
+        with lock:
+            self.threads[ident] -= 1
+            if not self.threads[ident]:
+                del self.threads[ident]
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with lock:
+                for ident in self.threads:
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    self.samples += 1
+
+                    key = frame_key(frame)
+                    self.own[key] = self.own.get(key, 0) + 1
+                    seen = set()
+                    while frame is not None:
+                        key = frame_key(frame)
+                        if key not in seen:
+                            seen.add(key)
+                            self.total[key] = self.total.get(key, 0) + 1
+                        frame = frame.f_back
+
+    def report(self, limit=30):
+        with lock:
+            if not self.samples:
+                return "No profile data\n"
+            text = "%d samples every %gs\n\n" % (self.samples, self.interval)
+            text += "   own%   total%  function\n"
+            for key in sorted(self.total, key=self.total.get, reverse=True)[:limit]:
+                text += "%6.1f  %6.1f   %s:%d(%s)\n" % (
+                        self.own.get(key, 0) * 100 / self.samples,
+                        self.total[key] * 100 / self.samples, *key)
+        return text
+
+def frame_key(frame):
+    code = frame.f_code
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+profilers = {"cprofile": CProfiler, "sample": Sampler}
+
+def enable(profile=None):
+    global enabled, profile_mode, profiler
+    if profile is not None and profile not in profile_modes:
+        raise ValueError("Unsupported profile mode: %s" % profile)
+    enabled = True
+    if profile is not None and profiler is None:
+        profile_mode = profile
+        profiler = profilers[profile]()
+
+def timed(name, func):
+    stage = stages.setdefault(name, [0, 0.0])
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with lock:
+                stage[0] += 1
+                stage[1] += elapsed
+    return wrapper
+
+def instrument(namespace, names, prefix=""):
+    # Replaces the given functions of a module's globals with timed ones
+    if not enabled:
+        return
+    for name in names:
+        if prefix + name not in stages:
+            namespace[name] = timed(prefix + name, namespace[name])
+
+def count(name, value=1, **labels):
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with lock:
+        counters[key] = counters.get(key, 0) + value
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join("%s=\"%s\"" % (key, str(value).replace("\\", "\\\\").replace("\"", "\\\""))
+            for key, value in labels)
+
+def metrics(extra=()):
+    # Prometheus text format. Extra metrics are (name, type, labels, value).
+    samples = []
+    with lock:
+        for name, (calls, seconds) in sorted(stages.items()):
+            samples.append(("password_stage_calls_total", "counter", (("stage", name),), calls))
+            samples.append(("password_stage_seconds_total", "counter", (("stage", name),), seconds))
+        for (name, labels), value in sorted(counters.items()):
+            samples.append((name, "counter", labels, value))
+    for name, type, labels, value in extra:
+        samples.append((name, type, tuple(sorted(labels.items())), value))
+
+    text = ""
+    types = {}
+    for name, type, labels, value in samples:
+        types.setdefault(name, type)
+    for name, type in types.items():
+        text += "# TYPE %s %s\n" % (name, type)
+        for sample in samples:
+            if sample[0] == name:
+                text += "%s%s %s\n" % (name, format_labels(sample[2]), sample[3])
+    return text
+
+def report():
+    text = "%-32s %10s %12s %12s\n" % ("stage", "calls", "total (s)", "mean (us)")
+    with lock:
+        for name, (calls, seconds) in sorted(stages.items(), key=lambda x: -x[1][1]):
+            if calls:
+                text += "%-32s %10d %12.4f %12.2f\n" % (name, calls, seconds, seconds * 1e6 / calls)
+    if profiler is not None:
+        text += "\n" + profiler.report()
+    return text
+
+if os.environ.get("PASSWORD_PROFILE"):
+    enable(os.environ["PASSWORD_PROFILE"])
+elif os.environ.get("PASSWORD_METRICS"):
+    enable()
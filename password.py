@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
 
-from sys import stderr, exit
+from sys import stderr, stdout, exit
+from array import array
 from datetime import datetime
+from functools import lru_cache
+import mmap
+import os
+import zlib
+import instrument
 import romdata
 
 class NumberGenerator():
@@ -41,56 +47,172 @@ class NumberGenerator():
         self.state[self.i1] = result
         return result
 
+charmap_symbols = [
+    "1F", "2F", "3F", "4F", "5F", "6F", "7F", "8F", "9F", "PF", "MF", "DF", "XF",
+    "1H", "2H", "3H", "4H", "5H", "6H", "7H", "8H", "9H", "PH", "MH", "DH", "XH",
+    "1W", "2W", "3W", "4W", "5W", "6W", "7W", "8W", "9W", "PW", "MW", "DW", "XW",
+    "1E", "2E", "3E", "4E", "5E", "6E", "7E", "8E", "9E", "PE", "ME", "DE", "XE",
+    "1S", "2S", "3S", "4S", "5S", "6S", "7S", "8S", "9S", "PS", "MS", "DS", #"XS",
+]
+
+charmap_symbols_index = {x: i for i, x in enumerate(charmap_symbols)}
+
+named_fields = {
+    "dungeon": "dungeons",
+    "pokemon": "pokemon",
+    "gender": "genders",
+    "reward": "rewards"
+}
+
+# Passwords are 30 6-bit symbols, which pack into 23 bytes, of which the first
+# two are the seed and aren't encrypted
+KEYSTREAM_SIZE = 21
+
+keystream_table = None
+
+@lru_cache(maxsize=4096)
+def make_keystream(seed):
+    gen = NumberGenerator(seed)
+    return bytes(gen.get() & 0xFF for x in range(KEYSTREAM_SIZE))
+
+def get_keystream(seed):
+    # Slices of a loaded table aren't worth caching in every process
+    if keystream_table is not None:
+        return keystream_table[seed * KEYSTREAM_SIZE:(seed + 1) * KEYSTREAM_SIZE]
+    return make_keystream(seed)
+
+def make_keystream_table():
+    # The keystream for every possible seed
+    table = bytearray()
+    for seed in range(0x10000):
+        gen = NumberGenerator(seed)
+        table += bytes(gen.get() & 0xFF for x in range(KEYSTREAM_SIZE))
+    return table
+
+def load_keystream_table(filename):
+    global keystream_table
+
+    # Generate the table once, and share the resulting file between
+    # processes by mapping it into memory
+    size = 0x10000 * KEYSTREAM_SIZE
+    if not os.path.exists(filename) or os.path.getsize(filename) != size:
+        with open(filename + ".tmp", "wb") as f:
+            f.write(make_keystream_table())
+        os.replace(filename + ".tmp", filename)
+
+    with open(filename, "rb") as f:
+        keystream_table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    make_keystream.cache_clear()
+
 class BitstreamReader():
-    def __init__(self, bytes, bytesize=8):
-        self.bytes = bytes
-        self.bytesize = bytesize
+    def __init__(self, data, bytesize=8):
+        # Load everything into a single integer, reads are served from that
+        if bytesize == 8 and isinstance(data, (bytes, bytearray, memoryview)):
+            self.value = int.from_bytes(data, "little")
+        else:
+            mask = (1 << bytesize) - 1
+            self.value = 0
+            for x in reversed(data):
+                self.value = (self.value << bytesize) | (x & mask)
+        self.size = len(data) * bytesize
         self.pos = 0
-        self.bits = 0
-        self.value = 0
 
     def remaining(self):
-        if self.pos < len(self.bytes):
-            return True
-        if self.bits > 0:
-            return True
-        return False
+        return self.pos < self.size
 
     def read(self, count):
-        while self.bits < count:
-            if self.pos >= len(self.bytes):
-                break
-            self.value |= (self.bytes[self.pos] & ((1 << self.bytesize) - 1)) << self.bits
-            self.bits += self.bytesize
-            self.pos += 1
-
-        ret = self.value & ((1 << count) - 1)
-        self.value >>= count
-        self.bits -= count
+        ret = (self.value >> self.pos) & ((1 << count) - 1)
+        self.pos += count
         return ret
 
 class BitstreamWriter():
     def __init__(self, bytesize=8):
-        self.bytes = []
         self.bytesize = bytesize
         self.bits = 0
         self.value = 0
 
-    def finish(self):
-        if self.bits > 0:
-            self.bytes.append(self.value & ((1 << self.bytesize) - 1))
-        return self.bytes
+    def finish(self, as_bytes=False):
+        count = (self.bits + self.bytesize - 1) // self.bytesize
+        if self.bytesize == 8:
+            data = self.value.to_bytes(count, "little")
+            return data if as_bytes else list(data)
+
+        mask = (1 << self.bytesize) - 1
+        data = [(self.value >> (x * self.bytesize)) & mask for x in range(count)]
+        return bytes(data) if as_bytes else data
 
     def write(self, value, bits):
         self.value |= (value & ((1 << bits) - 1)) << self.bits
         self.bits += bits
-        while self.bits >= self.bytesize:
-            self.bytes.append(self.value & ((1 << self.bytesize) - 1))
-            self.value >>= self.bytesize
-            self.bits -= self.bytesize
+
+shuffle = [3, 27, 13, 21, 12, 9, 7, 4, 6, 17, 19, 16, 28, 29, 23, 20, 11, 0, 1, 22, 24, 14, 8, 2, 15, 25, 10, 5, 18, 26]
+
+# Fields stored after the checksum byte, as (name, bits) or (name, bits, count).
+# Both layouts have to start the same way up to the type.
+layout_rescue = [
+    ("timestamp", 32), ("type", 1), ("unk1", 1), ("team", 9, 12),
+    ("dungeon", 7), ("floor", 7), ("pokemon", 11), ("gender", 2), ("reward", 2),
+    ("unk2", 1)
+]
+layout_revive = [
+    ("timestamp", 32), ("type", 1), ("unk1", 1), ("team", 9, 12),
+    ("revive", 30)
+]
+
+class Layout():
+    def __init__(self, layout):
+        # Compile the layout into (name, offset, bits, count) entries
+        self.fields = []
+        self.offsets = {}
+        offset = 0
+        for field in layout:
+            name, bits = field[:2]
+            count = field[2] if len(field) > 2 else 1
+            self.fields.append((name, offset, bits, count))
+            self.offsets[name] = offset
+            offset += bits * count
+        self.bits = offset
+        self.size = (offset + 7) // 8
+
+        # Generate the functions to convert between an info dict and an int
+        unpack = ["def unpack(data):", "    return {"]
+        pack = ["def pack(info):"]
+        values = []
+        for name, offset, bits, count in self.fields:
+            mask = (1 << bits) - 1
+            if count == 1:
+                unpack.append("        %r: data >> %d & 0x%X," % (name, offset, mask))
+                values.append("(info[%r] & 0x%X) << %d" % (name, mask, offset))
+                continue
+
+            unpack.append("        %r: [%s]," % (name, ", ".join(
+                    "data >> %d & 0x%X" % (offset + x * bits, mask) for x in range(count))))
+            pack.append("    %s = list(info[%r]) + [0] * %d" % (name, name, count))
+            for x in range(count):
+                values.append("(%s[%d] & 0x%X) << %d" % (name, x, mask, offset + x * bits))
+        unpack.append("    }")
+        pack.append("    return (" + " |\n        ".join(values) + ")")
+
+        self.source = "\n".join(unpack) + "\n\n" + "\n".join(pack) + "\n"
+        namespace = {}
+        exec(self.source, namespace)
+        self.unpack = namespace["unpack"]
+        self.pack = namespace["pack"]
+
+layouts = {0: Layout(layout_rescue), 1: Layout(layout_revive)}
+type_offset = layouts[0].offsets["type"]
+
+def get_layout(type):
+    return layouts[0] if type == 0 else layouts[1]
+
+# Largest value of every single field
+field_masks = {}
+for layout in layouts.values():
+    for name, offset, bits, count in layout.fields:
+        if count == 1:
+            field_masks.setdefault(name, (1 << bits) - 1)
 
 def apply_shuffle(code, reverse=False):
-    shuffle = [3, 27, 13, 21, 12, 9, 7, 4, 6, 17, 19, 16, 28, 29, 23, 20, 11, 0, 1, 22, 24, 14, 8, 2, 15, 25, 10, 5, 18, 26]
     newcode = [None] * len(shuffle)
     for i, x in enumerate(shuffle):
         if not reverse:
@@ -108,9 +230,13 @@ def apply_bitpack(code, origbits, destbits):
 
 def apply_crypto(code, encrypt=False):
     newcode = [code[0], code[1]]
-    gen = NumberGenerator(code[0] | code[1] << 8)
-    for x in code[2:]:
-        val = gen.get()
+    seed = code[0] | code[1] << 8
+    if len(code) - 2 <= KEYSTREAM_SIZE:
+        keystream = get_keystream(seed)
+    else:
+        gen = NumberGenerator(seed)
+        keystream = [gen.get() for x in code[2:]]
+    for x, val in zip(code[2:], keystream):
         if encrypt:
             val = -val
         newcode.append((x - val) & 0xFF)
@@ -135,13 +261,92 @@ def checksum(code):
     calc ^= 0xFF
     return calc
 
+# Copy of romdata.crc32table in shared memory, see share_tables()
+crc32_table_view = None
+tables_shared = False
+
 def crc32(bytes):
+    table = romdata.crc32table if crc32_table_view is None else crc32_table_view
     sum = 0xFFFFFFFF
     for x in bytes:
-        sum = romdata.crc32table[(sum & 0xFF) ^ x] ^ (sum >> 8)
+        sum = table[(sum & 0xFF) ^ x] ^ (sum >> 8)
     return sum ^ 0xFFFFFFFF
 
-def decode(code):
+def crc32_table(poly):
+    table = []
+    for x in range(256):
+        for y in range(8):
+            x = (x >> 1) ^ poly if x & 1 else x >> 1
+        table.append(x)
+    return tuple(table)
+
+crc32_engines = {"python": crc32}
+crc32_engine = "python"
+
+def set_crc32_engine(name):
+    global crc32_engine
+    if name not in crc32_engines:
+        raise ValueError("Unsupported CRC32 engine: %s" % name)
+    crc32_engine = name
+    if tables_shared:
+        share_crc32_table()
+
+def share_crc32_table():
+    # Only the python engine reads the table, zlib has its own
+    global crc32_table_view
+    crc32_table_view = None
+    if crc32_engine != "python":
+        return
+
+    table = array("I", romdata.crc32table)
+    shared = mmap.mmap(-1, len(table) * table.itemsize)
+    shared[:] = table.tobytes()
+    crc32_table_view = memoryview(shared).cast("I")
+
+def share_tables(keystream_file=None):
+    # Move the keystream and CRC tables into memory that's shared with every
+    # process forked afterwards, instead of each of them having its own copy.
+    # The keystream table is generated if there's no file to map it from,
+    # which takes a few seconds.
+    global keystream_table, tables_shared
+
+    if keystream_file:
+        load_keystream_table(keystream_file)
+    elif keystream_table is None:
+        table = make_keystream_table()
+        keystream_table = mmap.mmap(-1, len(table))
+        keystream_table[:] = table
+        make_keystream.cache_clear()
+
+    tables_shared = True
+    share_crc32_table()
+
+charmap_utf8 = None
+
+def reload_tables():
+    # Rebuild everything derived from romdata, which has to be done again
+    # whenever it's loaded again
+    global charmap_utf8, crc32_engine
+    charmap_utf8 = [x.encode("utf8") for x in romdata.charmap]
+
+    # zlib can only be used if the game uses the standard CRC32 polynomial
+    if romdata.crc32table == crc32_table(0xEDB88320):
+        if "zlib" not in crc32_engines:
+            crc32_engines["zlib"] = zlib.crc32
+            crc32_engine = "zlib"
+    else:
+        crc32_engines.pop("zlib", None)
+        crc32_engine = "python"
+
+    if tables_shared:
+        share_crc32_table()
+
+reload_tables()
+
+def charcode_crc32(code):
+    return crc32_engines[crc32_engine](b"".join(charmap_utf8[x] for x in code))
+
+def decode_stream(code):
     origcode = code
     code = apply_shuffle(code)
     code = apply_bitpack(code, 6, 8)
@@ -151,62 +356,162 @@ def decode(code):
     info["incl_checksum"] = code[0]
     info["calc_checksum"] = checksum(code[1:])
 
+    # The layouts only differ after the type, so switch once it's known
     reader = BitstreamReader(code[1:])
-    info["timestamp"] = reader.read(32)
-    info["type"] = reader.read(1)
-    info["unk1"] = reader.read(1)
-    team = []
-    for x in range(12):
-        team.append(reader.read(9))
-    info["team"] = team
+    layout = layouts[0]
+    x = 0
+    while x < len(layout.fields):
+        name, offset, bits, count = layout.fields[x]
+        if count == 1:
+            info[name] = reader.read(bits)
+        else:
+            info[name] = [reader.read(bits) for y in range(count)]
+        if name == "type":
+            layout = get_layout(info["type"])
+        x += 1
+
     if info["type"] == 0:
-        info["dungeon"] = reader.read(7)
-        info["floor"] = reader.read(7)
-        info["pokemon"] = reader.read(11)
-        info["gender"] = reader.read(2)
-        info["reward"] = reader.read(2)
-        info["unk2"] = reader.read(1)
-
-        charcode = ""
-        for x in origcode:
-            charcode += romdata.charmap[x]
-        info["revive"] = crc32(charcode.encode("utf8")) & 0x3FFFFFFF
-    else:
-        info["revive"] = reader.read(30)
+        info["revive"] = charcode_crc32(origcode) & 0x3FFFFFFF
 
     return info
 
-def encode(info, keep_checksum=False):
-    writer = BitstreamWriter()
-    writer.write(info["timestamp"], 32)
-    writer.write(info["type"], 1)
-    writer.write(info["unk1"], 1)
-    for x in range(12):
-        if x < len(info["team"]):
-            writer.write(info["team"][x], 9)
-        else:
-            writer.write(0, 9)
-    if info["type"] == 0:
-        writer.write(info["dungeon"], 7)
-        writer.write(info["floor"], 7)
-        writer.write(info["pokemon"], 11)
-        writer.write(info["gender"], 2)
-        writer.write(info["reward"], 2)
-        writer.write(info["unk2"], 1)
-    else:
-        writer.write(info["revive"], 30)
+def decode_fused(code):
+    # Gather the symbols straight into their bitpacked form
+    value = 0
+    for x, index in enumerate(shuffle):
+        value |= code[index] << (x * 6)
+    buf = bytearray(value.to_bytes((len(shuffle) * 6 + 7) // 8, "little"))
+
+    keystream = get_keystream(buf[0] | buf[1] << 8)
+    for x in range(2, len(buf)):
+        buf[x] = (buf[x] - keystream[x - 2]) & 0xFF
+    buf[-1] &= (1 << (8 - len(buf) * 8 % 6)) - 1
+
+    info = {}
+    info["incl_checksum"] = buf[0]
+    info["calc_checksum"] = checksum(memoryview(buf)[1:])
+
+    data = int.from_bytes(buf[1:], "little")
+    type = data >> type_offset & 1
+    info.update(layouts[type].unpack(data))
+    if type == 0:
+        info["revive"] = charcode_crc32(code) & 0x3FFFFFFF
+
+    return info
+
+decode_engines = {"stream": decode_stream, "fused": decode_fused}
+decode_engine = "fused"
 
-    code = writer.finish()
+def set_decode_engine(name):
+    global decode_engine
+    if name not in decode_engines:
+        raise ValueError("Unsupported decode engine: %s" % name)
+    decode_engine = name
+
+def decode(code):
+    return decode_engines[decode_engine](code)
+
+def encode(info, keep_checksum=False, with_info=False):
+    # With with_info, returns the code along with the info decode() would
+    # return for it, without decoding it again
+    layout = get_layout(info["type"])
+    data = layout.pack(info)
+    code = list(data.to_bytes(layout.size, "little"))
+    calc = None
+    if not keep_checksum or with_info:
+        calc = checksum(code)
     if keep_checksum:
         code = [info["incl_checksum"]] + code
     else:
-        code = [checksum(code)] + code
+        code = [calc] + code
     code = apply_crypto(code, encrypt=True)
     code = apply_bitpack(code, 8, 6)
     code = apply_shuffle(code, reverse=True)
 
+    if not with_info:
+        return code
+
+    incl = info["incl_checksum"] if keep_checksum else calc
+    result = {"incl_checksum": incl, "calc_checksum": calc}
+    result.update(layout.unpack(data))
+    if result["type"] != info["type"] or not 0 <= incl <= 0xFF:
+        # Types other than 0 and 1, and checksums that don't fit in a byte,
+        # don't decode to what was given
+        return code, decode(code)
+    if result["type"] == 0:
+        result["revive"] = charcode_crc32(code) & 0x3FFFFFFF
+    return code, result
+
+def parse_password(password):
+    # Symbols are two characters each, and may be split up by whitespace
+    code = []
+    start = None
+    for pos, char in enumerate(password):
+        if char.isspace():
+            continue
+        if start is None:
+            start = pos
+            continue
+
+        symbol = (password[start] + char).upper()
+        if symbol not in charmap_symbols_index:
+            raise ValueError("Invalid symbol \"%s\" at position %d" % (symbol, start))
+        code.append(charmap_symbols_index[symbol])
+        start = None
+
+    if start is not None or len(code) != 30:
+        raise ValueError("Invalid code length")
     return code
 
+def format_password(code):
+    return "".join(charmap_symbols[x] for x in code)
+
+def encode_team(team):
+    if len(team) > 12:
+        raise ValueError("Team name is too long")
+    index = romdata.charmap_text_index
+    for pos, char in enumerate(team):
+        if char not in index:
+            raise ValueError("Invalid team name character \"%s\" at position %d" % (char, pos))
+    return [index[x] for x in team]
+
+def decode_team(team):
+    text = ""
+    for char in team:
+        if char == 0:
+            break
+        if char < len(romdata.charmap_text):
+            text += romdata.charmap_text[char]
+        else:
+            text += "★"
+    return text
+
+def decode_many(codes):
+    for code in codes:
+        yield decode(code)
+
+def encode_many(infos, keep_checksum=False):
+    for info in infos:
+        yield encode(info, keep_checksum=keep_checksum)
+
+def get_warnings(info):
+    warnings = []
+
+    if "calc_checksum" in info and "incl_checksum" in info:
+        if info["calc_checksum"] != info["incl_checksum"]:
+            warnings.append("checksum")
+
+    if info["type"] == 0:
+        for field, array in named_fields.items():
+            if not romdata.is_valid(array, info[field]):
+                warnings.append(field)
+
+        dungeon = romdata.get_entry("dungeons", info["dungeon"])
+        if info["floor"] == 0 or info["floor"] > dungeon.floors:
+            warnings.append("floor")
+
+    return warnings
+
 def print_info(info):
     info_text = ""
 
@@ -215,46 +520,38 @@ def print_info(info):
     info_text += "Revive: %s\n" % (info["type"] == 1)
     info_text += "Unk1: 0x%X\n" % info["unk1"]
 
-    info_text += "Team Name: "
-    for char in info["team"]:
-        if char == 0:
-            break
-        if char < 402:
-            info_text += romdata.charmap_text[char]
-        else:
-            info_text += "★"
-    info_text += "\n"
+    info_text += "Team Name: %s\n" % decode_team(info["team"])
 
     if info["type"] == 0:
-        dungeon = romdata.get_index("dungeons", info["dungeon"])
-        info_text += "Dungeon (%d): %s" % (info["dungeon"], dungeon["name"])
-        if not dungeon["valid"]:
+        dungeon = romdata.get_entry("dungeons", info["dungeon"])
+        info_text += "Dungeon (%d): %s" % (info["dungeon"], dungeon.name)
+        if not dungeon.valid:
             info_text += " (!)"
         info_text += "\n"
 
         floor = "%dF" % info["floor"]
-        if not dungeon["ascending"]:
+        if not dungeon.ascending:
             floor = "B" + floor
         info_text += "Floor: %s" % floor
-        if info["floor"] == 0 or info["floor"] > dungeon["floors"]:
+        if info["floor"] == 0 or info["floor"] > dungeon.floors:
             info_text += " (!)"
         info_text += "\n"
 
-        pokemon = romdata.get_index("pokemon", info["pokemon"])
-        info_text += "Pokemon (%d): %s" % (info["pokemon"], pokemon["name"])
-        if not pokemon["valid"]:
+        pokemon = romdata.get_entry("pokemon", info["pokemon"])
+        info_text += "Pokemon (%d): %s" % (info["pokemon"], pokemon.name)
+        if not pokemon.valid:
             info_text += " (!)"
         info_text += "\n"
 
-        gender = romdata.get_index("genders", info["gender"])
-        info_text += "Gender: %s" % gender["name"]
-        if not gender["valid"]:
+        gender = romdata.get_entry("genders", info["gender"])
+        info_text += "Gender: %s" % gender.name
+        if not gender.valid:
             info_text += " (!)"
         info_text += "\n"
 
-        reward = romdata.get_index("rewards", info["reward"])
-        info_text += "Reward: %s" % reward["name"]
-        if not reward["valid"]:
+        reward = romdata.get_entry("rewards", info["reward"])
+        info_text += "Reward: %s" % reward.name
+        if not reward.valid:
             info_text += " (!)"
         info_text += "\n"
 
@@ -263,41 +560,114 @@ def print_info(info):
     info_text += "Revive value: 0x%08X\n" % info["revive"]
     return info_text
 
-if __name__ == "__main__":
-    charmap_symbols = [
-        "1F", "2F", "3F", "4F", "5F", "6F", "7F", "8F", "9F", "PF", "MF", "DF", "XF",
-        "1H", "2H", "3H", "4H", "5H", "6H", "7H", "8H", "9H", "PH", "MH", "DH", "XH",
-        "1W", "2W", "3W", "4W", "5W", "6W", "7W", "8W", "9W", "PW", "MW", "DW", "XW",
-        "1E", "2E", "3E", "4E", "5E", "6E", "7E", "8E", "9E", "PE", "ME", "DE", "XE",
-        "1S", "2S", "3S", "4S", "5S", "6S", "7S", "8S", "9S", "PS", "MS", "DS", #"XS",
-    ]
+# Timed when instrumentation is enabled
+instrumented_stages = [
+    "apply_shuffle", "apply_bitpack", "apply_crypto", "checksum", "charcode_crc32",
+    "decode", "encode", "parse_password", "get_warnings", "print_info"
+]
+instrument.instrument(globals(), instrumented_stages, prefix="password.")
 
+if __name__ == "__main__":
     import json
 
+    def batch(args):
+        if args.password is None or args.password == "-":
+            from sys import stdin
+            from contextlib import nullcontext
+            lines = nullcontext(stdin)
+        else:
+            lines = open(args.password)
+
+        writer = None
+        if args.columnar:
+            import columnar
+            writer = columnar.ColumnWriter(args.columnar)
+
+        # Every record has the number of the line it comes from. With
+        # --columnar, only errors are printed, and to stderr.
+        errors = stderr if writer else stdout
+        with lines as lines:
+            for number, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+
+                if args.decode:
+                    try:
+                        code = parse_password(line)
+                    except ValueError as e:
+                        print(json.dumps({"line": number, "password": line.strip(), "error": str(e)}), file=errors)
+                        continue
+                    info = decode(code)
+                    if writer:
+                        writer.add(info, line=number)
+                        continue
+                    if not args.encode:
+                        print(json.dumps({"line": number, "password": format_password(code), "info": info}))
+                        continue
+
+                try:
+                    if not args.decode:
+                        info = json.loads(line)
+                    code = encode(info, keep_checksum=args.keep_checksum)
+                except KeyError as e:
+                    print(json.dumps({"line": number, "error": "Missing field: %s" % e.args[0]}))
+                    continue
+                except (ValueError, TypeError) as e:
+                    print(json.dumps({"line": number, "error": str(e)}))
+                    continue
+                print(json.dumps({"line": number, "password": format_password(code)}))
+
+        if writer:
+            writer.close()
+
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("-d", "--decode", action="store_true")
     parser.add_argument("-e", "--encode", action="store_true")
     parser.add_argument("-i", "--info", action="store_true")
     parser.add_argument("-k", "--keep-checksum", action="store_true")
-    parser.add_argument("password")
+    parser.add_argument("-b", "--batch", action="store_true",
+            help="read one password (or json for --encode) per line from the file given as password, or stdin")
+    parser.add_argument("--columnar",
+            help="with --batch --decode, write the results to this file in the format of columnar.py")
+    parser.add_argument("--keystream-file",
+            help="precomputed keystream table, generated if it doesn't exist")
+    parser.add_argument("--crc32", choices=crc32_engines, default=crc32_engine)
+    parser.add_argument("--decode-engine", choices=decode_engines, default=decode_engine)
+    parser.add_argument("--profile", action="store_true",
+            help="print the time spent in every stage and a profile to stderr when done, with cProfile unless PASSWORD_PROFILE=sample")
+    parser.add_argument("password", nargs="?")
     args = parser.parse_args()
 
+    if args.profile:
+        import atexit
+        instrument.enable(instrument.profile_mode or "cprofile")
+        instrument.instrument(globals(), instrumented_stages, prefix="password.")
+        atexit.register(lambda: print(instrument.report(), end="", file=stderr))
+        atexit.register(instrument.profiler.stop, instrument.profiler.start())
+
+    set_crc32_engine(args.crc32)
+    set_decode_engine(args.decode_engine)
+
+    if args.keystream_file:
+        load_keystream_table(args.keystream_file)
+
+    if args.batch:
+        batch(args)
+        exit(0)
+
+    if args.password is None:
+        parser.error("the following arguments are required: password")
+
     info = None
 
     if args.decode:
-        code = "".join(args.password.split()).upper()
-        if len(code) != 30 * 2:
-            print("Invalid code length", file=stderr)
+        try:
+            code = parse_password(args.password)
+        except ValueError as e:
+            print(e, file=stderr)
             exit(1)
 
-        # Convert the characters to codepoints
-        newcode = []
-        for x in range(len(code) // 2):
-            char = code[x * 2:x * 2 + 2]
-            newcode.append(charmap_symbols.index(char))
-        code = newcode
-
         info = decode(code)
         print(json.dumps(info))
 
@@ -305,7 +675,7 @@ if __name__ == "__main__":
         if not info:
             info = json.loads(args.password)
 
-        code = encode(info, keep_checksum=args.keep_checksum)
+        code, info = encode(info, keep_checksum=args.keep_checksum, with_info=True)
         i = 0
         for x in code:
             print(charmap_symbols[x], end="")
@@ -314,7 +684,6 @@ if __name__ == "__main__":
                 print()
             elif i % 5 == 0:
                 print(" ", end="")
-        info = decode(code)
 
     if args.info and info:
         print(print_info(info))
@@ -0,0 +1,181 @@
+# Vectorized version of the codec in password.py, working on arrays of
+# passwords at once. Requires numpy.
+
+import numpy as np
+import password
+import romdata
+
+shuffle = np.array(password.shuffle)
+
+def field_dtype(bits):
+    if bits <= 8:
+        return np.uint8
+    if bits <= 16:
+        return np.uint16
+    return np.uint32
+
+# One column for every field of every layout
+info_fields = [("incl_checksum", np.uint8), ("calc_checksum", np.uint8)]
+for layout in password.layouts.values():
+    for name, offset, bits, count in layout.fields:
+        if name in [x[0] for x in info_fields]:
+            continue
+        if count == 1:
+            info_fields.append((name, field_dtype(bits)))
+        else:
+            info_fields.append((name, field_dtype(bits), (count,)))
+info_dtype = np.dtype(info_fields)
+
+crc32table = np.array(romdata.crc32table, dtype=np.uint32)
+
+# UTF-8 bytes of every charmap character, padded to the longest one
+charmap_utf8 = [x.encode("utf8") for x in romdata.charmap]
+charmap_len = np.array([len(x) for x in charmap_utf8])
+charmap_bytes = np.zeros((len(charmap_utf8), charmap_len.max()), dtype=np.uint32)
+for i, x in enumerate(charmap_utf8):
+    charmap_bytes[i, :len(x)] = list(x)
+
+def get_keystreams(seeds):
+    if password.keystream_table is not None:
+        table = np.frombuffer(password.keystream_table, dtype=np.uint8)
+        return table.reshape(-1, password.KEYSTREAM_SIZE)[seeds]
+
+    unique, inverse = np.unique(seeds, return_inverse=True)
+    keystreams = np.array([list(password.get_keystream(int(x))) for x in unique], dtype=np.uint8)
+    return keystreams.reshape(-1, password.KEYSTREAM_SIZE)[inverse]
+
+def apply_crypto(code, encrypt=False):
+    code = code.copy()
+    seeds = code[:, 0].astype(np.intp) | code[:, 1].astype(np.intp) << 8
+    keystreams = get_keystreams(seeds)
+    size = code.shape[1] - 2
+    if encrypt:
+        code[:, 2:] += keystreams[:, :size]
+    else:
+        code[:, 2:] -= keystreams[:, :size]
+
+    # Ignore the part that's 0 as a result of bitpacking
+    remain = 8 - (code.shape[1] * 8 % 6)
+    code[:, -1] &= (1 << remain) - 1
+    return code
+
+def checksum(code):
+    code = code.astype(np.uint32)
+    calc = code[:, 0].copy()
+    end = (code.shape[1] - 1) // 2 * 2
+    calc += (code[:, 1:end:2] | code[:, 2:end + 1:2] << 8).sum(axis=1, dtype=np.uint32)
+    if code.shape[1] % 2 == 0:
+        calc += code[:, -1]
+
+    calc = ((calc >> 16) & 0xFFFF) + (calc & 0xFFFF)
+    calc += calc >> 16
+    calc = ((calc >> 8) & 0xFF) + (calc & 0xFF)
+    calc += calc >> 8
+    calc &= 0xFF
+    calc ^= 0xFF
+    return calc.astype(np.uint8)
+
+def crc32(code):
+    # Same as password.crc32 over the charmap characters of every password
+    sum = np.full(code.shape[0], 0xFFFFFFFF, dtype=np.uint32)
+    for x in range(code.shape[1]):
+        symbols = code[:, x]
+        for y in range(charmap_bytes.shape[1]):
+            new = crc32table[(sum & 0xFF) ^ charmap_bytes[symbols, y]] ^ (sum >> 8)
+            sum = np.where(charmap_len[symbols] > y, new, sum)
+    return sum ^ 0xFFFFFFFF
+
+def read_bits(bits, offset, count):
+    weights = np.uint64(1) << np.arange(count, dtype=np.uint64)
+    return (bits[:, offset:offset + count].astype(np.uint64) * weights).sum(axis=1, dtype=np.uint64)
+
+def write_bits(bits, offset, count, value):
+    value = np.asarray(value, dtype=np.uint64)
+    shifts = np.arange(count, dtype=np.uint64)
+    bits[:, offset:offset + count] |= ((value[:, None] >> shifts) & 1).astype(np.uint8)
+
+def layout_rows(info, type):
+    # Same choice as password.get_layout
+    if type == 0:
+        return info["type"] == 0
+    return info["type"] != 0
+
+def decode(codes):
+    codes = np.asarray(codes, dtype=np.uint8)
+    total = codes.shape[0]
+
+    # Unshuffle and unpack the 6-bit symbols into bytes
+    code = codes[:, shuffle]
+    bits = (code[:, :, None] >> np.arange(6, dtype=np.uint8)) & 1
+    bits = bits.reshape(total, -1)
+    bits = np.pad(bits, ((0, 0), (0, -bits.shape[1] % 8)))
+    code = np.packbits(bits, axis=1, bitorder="little")
+    code = apply_crypto(code)
+
+    info = np.zeros(total, dtype=info_dtype)
+    info["incl_checksum"] = code[:, 0]
+    info["calc_checksum"] = checksum(code[:, 1:])
+
+    bits = np.unpackbits(code[:, 1:], axis=1, bitorder="little")
+    info["type"] = read_bits(bits, password.type_offset, 1)
+    for type, layout in password.layouts.items():
+        rows = layout_rows(info, type)
+        for name, offset, size, count in layout.fields:
+            if count == 1:
+                info[name][rows] = read_bits(bits[rows], offset, size)
+                continue
+            for x in range(count):
+                info[name][rows, x] = read_bits(bits[rows], offset + x * size, size)
+
+    rescue = info["type"] == 0
+    info["revive"][rescue] = crc32(codes[rescue]) & 0x3FFFFFFF
+
+    return info
+
+def encode(info, keep_checksum=False):
+    info = np.asarray(info, dtype=info_dtype)
+    total = info.shape[0]
+
+    size = max(layout.size for layout in password.layouts.values())
+    bits = np.zeros((total, size * 8), dtype=np.uint8)
+    for type, layout in password.layouts.items():
+        rows = layout_rows(info, type)
+        for name, offset, size, count in layout.fields:
+            if count == 1:
+                write_bits(bits, offset, size, np.where(rows, info[name], 0))
+                continue
+            for x in range(count):
+                write_bits(bits, offset + x * size, size, np.where(rows, info[name][:, x], 0))
+
+    data = np.packbits(bits, axis=1, bitorder="little")
+    if keep_checksum:
+        sum = info["incl_checksum"]
+    else:
+        sum = checksum(data)
+    code = np.concatenate([sum[:, None], data], axis=1)
+    code = apply_crypto(code, encrypt=True)
+
+    # Pack the bytes into 6-bit symbols and shuffle them
+    bits = np.unpackbits(code, axis=1, bitorder="little")
+    bits = bits[:, :len(shuffle) * 6].reshape(total, len(shuffle), 6)
+    code = (bits << np.arange(6, dtype=np.uint8)).sum(axis=2, dtype=np.uint8)
+    codes = np.empty_like(code)
+    codes[:, shuffle] = code
+    return codes
+
+# Fields of every type, in the order password.decode() returns them
+dict_fields = {}
+for type, layout in password.layouts.items():
+    dict_fields[type] = ["incl_checksum", "calc_checksum"] + [x[0] for x in layout.fields]
+    if "revive" not in dict_fields[type]:
+        dict_fields[type].append("revive")
+
+def decode_many(codes):
+    # Same as password.decode_many(), returning a list of dicts, but decoding
+    # all the passwords at once
+    if not len(codes):
+        return []
+    info = decode(codes)
+    columns = {name: info[name].tolist() for name in info.dtype.names}
+    return [{name: columns[name][x] for name in dict_fields[type]}
+            for x, type in enumerate(columns["type"])]
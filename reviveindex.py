@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+# Persistent index of rescue passwords by their revive value, to find which
+# rescue a revival password answers.
+#
+# The index is made of two files:
+# - <name>.records: every rescue password added, as its 30 symbols followed by
+#   its revive value as a little-endian 32-bit integer.
+# - <name>.table: a header followed by an open-addressing hash table, with a
+#   64-bit slot for every entry: the revive value in the top 32 bits, and the
+#   record number plus one in the bottom 32 bits (0 for empty slots).
+
+from sys import stderr, exit
+import mmap
+import os
+import struct
+import password
+
+magic = b"PWDREVI\0"
+header_format = "<8sQQ"
+header_size = struct.calcsize(header_format)
+record_size = 34
+min_slots = 1 << 10
+
+class RevivalIndex():
+    def __init__(self, name):
+        self.records_path = name + ".records"
+        self.table_path = name + ".table"
+
+        self.records = open(self.records_path, "a+b")
+        self.count = self.records.seek(0, os.SEEK_END) // record_size
+
+        # Drop what's left of a record that was only partly written
+        self.records.truncate(self.count * record_size)
+
+        if not os.path.exists(self.table_path):
+            self.create_table(min_slots)
+        self.open_table()
+
+        # Records lost that way can't be indexed anymore
+        if self.indexed > self.count:
+            self.rebuild()
+
+        # Catch up with records added since the table was last written
+        if self.indexed < self.count:
+            if (self.count + 1) * 2 > self.slots:
+                self.rebuild()
+            else:
+                for x in range(self.indexed, self.count):
+                    code, revive = self.read_record(x)
+                    self.insert(revive, x)
+                self.set_indexed(self.count)
+
+    def create_table(self, slots):
+        with open(self.table_path + ".tmp", "wb") as f:
+            f.write(struct.pack(header_format, magic, slots, 0))
+            f.truncate(header_size + slots * 8)
+        os.replace(self.table_path + ".tmp", self.table_path)
+
+    def open_table(self):
+        with open(self.table_path, "r+b") as f:
+            self.map = mmap.mmap(f.fileno(), 0)
+        file_magic, self.slots, self.indexed = struct.unpack_from(header_format, self.map)
+        if file_magic != magic:
+            raise ValueError("Not a revival index")
+        self.table = memoryview(self.map)[header_size:].cast("Q")
+
+    def close_table(self):
+        self.table.release()
+        self.map.close()
+
+    def set_indexed(self, indexed):
+        self.indexed = indexed
+        struct.pack_into(header_format, self.map, 0, magic, self.slots, indexed)
+
+    def read_record(self, number):
+        self.records.seek(number * record_size)
+        data = self.records.read(record_size)
+        return list(data[:30]), int.from_bytes(data[30:], "little")
+
+    def insert(self, revive, number):
+        mask = self.slots - 1
+        slot = revive & mask
+        while self.table[slot]:
+            slot = (slot + 1) & mask
+        self.table[slot] = revive << 32 | (number + 1)
+
+    def find(self, revive):
+        # Record numbers of every entry with this revive value
+        mask = self.slots - 1
+        slot = revive & mask
+        while self.table[slot]:
+            entry = self.table[slot]
+            if entry >> 32 == revive:
+                yield (entry & 0xFFFFFFFF) - 1
+            slot = (slot + 1) & mask
+
+    def rebuild(self):
+        slots = self.slots
+        while (self.count + 1) * 2 > slots:
+            slots *= 2
+        self.close_table()
+        self.create_table(slots)
+        self.open_table()
+        for x in range(self.count):
+            code, revive = self.read_record(x)
+            self.insert(revive, x)
+        self.set_indexed(self.count)
+
+    def add(self, code, info=None, bad_checksum=False):
+        # Returns False for revival passwords, or if the rescue is already known.
+        # Passwords with the wrong checksum are rejected by the game, so they
+        # aren't added either unless asked to.
+        if info is None:
+            info = password.decode(code)
+        if info["type"] != 0:
+            return False
+        if info["incl_checksum"] != info["calc_checksum"] and not bad_checksum:
+            return False
+        revive = info["revive"]
+        for number in self.find(revive):
+            if self.read_record(number)[0] == list(code):
+                return False
+
+        if (self.count + 1) * 2 > self.slots:
+            self.rebuild()
+        self.records.seek(0, os.SEEK_END)
+        self.records.write(bytes(code) + revive.to_bytes(4, "little"))
+        self.records.flush()
+        self.insert(revive, self.count)
+        self.count += 1
+        self.set_indexed(self.count)
+        return True
+
+    def lookup(self, revive):
+        return [self.read_record(x)[0] for x in self.find(revive)]
+
+    def lookup_revival(self, code):
+        # Rescue passwords answered by the given revival password
+        info = password.decode(code)
+        if info["type"] != 1:
+            return []
+        return self.lookup(info["revive"])
+
+    def close(self):
+        self.map.flush()
+        self.close_table()
+        self.records.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-a", "--add", metavar="FILE",
+            help="add the rescue passwords in a file (in any format archive.py reads), or - for stdin")
+    parser.add_argument("--bad-checksum", action="store_true",
+            help="also add rescue passwords with the wrong checksum")
+    parser.add_argument("-f", "--find", metavar="PASSWORD",
+            help="find the rescue passwords for a revival password or revive value")
+    parser.add_argument("index", help="base name of the index files")
+    args = parser.parse_args()
+
+    with RevivalIndex(args.index) as index:
+        if args.add:
+            import archive
+            added = 0
+            lines = archive.read_lines(args.add)
+            for number, code, info in archive.decode_archive(lines):
+                if code and index.add(code, info, bad_checksum=args.bad_checksum):
+                    added += 1
+            print("Added %d rescue passwords, %d total" % (added, index.count), file=stderr)
+
+        if args.find:
+            try:
+                rescues = index.lookup(int(args.find, 0))
+            except ValueError:
+                try:
+                    rescues = index.lookup_revival(password.parse_password(args.find))
+                except ValueError as e:
+                    print(e, file=stderr)
+                    exit(1)
+            for code in rescues:
+                print(password.format_password(code))
+            if not rescues:
+                exit(1)
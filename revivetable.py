@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+
+# Exhaustive table of the revive values of every valid rescue password within
+# a range of parameters, to find which rescues a revive value could come from.
+#
+# Candidates are numbered like in search.py, with the team varying the slowest.
+# The table is a directory of shards, each a sorted little-endian array of
+# (revive value, candidate number) pairs of 64-bit integers, and a manifest
+# with the parameters of the sweep and the range of revive values of every
+# shard. Sweeping writes one shard per chunk of candidates, and merging joins
+# them into larger shards that don't overlap, a limited number at a time.
+
+from sys import byteorder, stderr, exit
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from array import array
+import heapq
+import json
+import mmap
+import os
+import time
+import password
+import search
+from lrucache import LRUCache
+
+def get_ranges(manifest):
+    ranges = [(field, range(start, stop)) for field, start, stop in manifest["ranges"]]
+    ranges.append(("team", [password.encode_team(x) for x in manifest["teams"]]))
+    return ranges
+
+def get_total(ranges):
+    total = 1
+    for field, values in ranges:
+        total *= len(values)
+    return total
+
+def load_manifest(directory):
+    with open(os.path.join(directory, "manifest.json")) as f:
+        return json.load(f)
+
+def save_manifest(directory, manifest):
+    filename = os.path.join(directory, "manifest.json")
+    with open(filename + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(filename + ".tmp", filename)
+
+def write_shard(filename, records, block_size=1 << 16):
+    # Returns the shard's entry in the manifest. Records are written as they
+    # come, so they don't all need to be in memory.
+    count = 0
+    first = None
+    with open(filename, "wb") as f:
+        data = array("Q")
+        for revive, index in records:
+            if first is None:
+                first = revive
+            data.append(revive)
+            data.append(index)
+            if len(data) >= block_size * 2:
+                count += len(data) // 2
+                if byteorder != "little":
+                    data.byteswap()
+                data.tofile(f)
+                data = array("Q")
+        count += len(data) // 2
+        if byteorder != "little":
+            data.byteswap()
+        data.tofile(f)
+    return [os.path.basename(filename), count, first, revive]
+
+def sweep_chunk(ranges, directory, start, end):
+    # Runs in the worker processes
+    records = []
+    for index in range(start, end):
+        info = search.get_candidate(ranges, None, index)
+        if password.get_warnings(info):
+            continue
+        code = password.encode(info)
+        records.append((password.charcode_crc32(code) & 0x3FFFFFFF, index))
+    if not records:
+        return None
+    records.sort()
+    return write_shard(os.path.join(directory, "chunk-%d.bin" % start), records)
+
+def sweep(directory, ranges, teams, jobs=None, chunk_size=100000):
+    manifest = {
+        "ranges": [[field, values.start, values.stop] for field, values in ranges],
+        "teams": teams,
+        "chunk_size": chunk_size,
+        "done": [],
+        "shards": []
+    }
+    os.makedirs(directory, exist_ok=True)
+    if os.path.exists(os.path.join(directory, "manifest.json")):
+        previous = load_manifest(directory)
+        if [previous[x] for x in ("ranges", "teams", "chunk_size")] != \
+                [manifest[x] for x in ("ranges", "teams", "chunk_size")]:
+            print("Table doesn't match the sweep parameters", file=stderr)
+            exit(1)
+        manifest = previous
+
+    ranges = get_ranges(manifest)
+    total = get_total(ranges)
+    if total > 1 << 64:
+        print("Too many candidates to sweep", file=stderr)
+        exit(1)
+
+    done = set(manifest["done"])
+    chunks = (x for x in range(0, total, chunk_size) if x not in done)
+    swept = 0
+    start_time = time.monotonic()
+    report_time = start_time
+
+    if not jobs:
+        jobs = os.cpu_count()
+    executor = ProcessPoolExecutor(jobs)
+    pending = {}
+
+    def submit():
+        for start in chunks:
+            end = min(start + chunk_size, total)
+            future = executor.submit(sweep_chunk, ranges, directory, start, end)
+            pending[future] = (start, end)
+            if len(pending) >= jobs * 2:
+                break
+
+    try:
+        submit()
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                start, end = pending.pop(future)
+                shard = future.result()
+                if shard:
+                    manifest["shards"].append(shard)
+                manifest["done"].append(start)
+                swept += end - start
+
+            now = time.monotonic()
+            if now - report_time >= 1:
+                report_time = now
+                print("%d/%d chunks, %d candidates/s" % (
+                        len(manifest["done"]), (total + chunk_size - 1) // chunk_size,
+                        swept / (now - start_time)), file=stderr)
+                save_manifest(directory, manifest)
+            submit()
+    except KeyboardInterrupt:
+        print("Interrupted", file=stderr)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        save_manifest(directory, manifest)
+
+    elapsed = time.monotonic() - start_time
+    print("Swept %d candidates in %.2fs (%d/s)" % (
+            swept, elapsed, swept / elapsed if elapsed else 0), file=stderr)
+    return manifest
+
+def map_shard(directory, shard):
+    if byteorder != "little":
+        raise ValueError("Revival tables can only be mapped on little-endian machines")
+    with open(os.path.join(directory, shard[0]), "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(data).cast("Q")
+
+def read_shard(directory, shard, block_size=1 << 16):
+    with open(os.path.join(directory, shard[0]), "rb") as f:
+        while True:
+            data = array("Q")
+            data.frombytes(f.read(block_size * data.itemsize * 2))
+            if not data:
+                break
+            if byteorder != "little":
+                data.byteswap()
+            for x in range(0, len(data), 2):
+                yield data[x], data[x + 1]
+
+def merge_pass(directory, manifest, fan_in):
+    # Joins every group of fan_in shards into one, so the final merge doesn't
+    # have more files open at once than that
+    manifest["generation"] = manifest.get("generation", 0) + 1
+    old = manifest["shards"]
+    shards = []
+    for x in range(0, len(old), fan_in):
+        records = heapq.merge(*[read_shard(directory, y) for y in old[x:x + fan_in]])
+        filename = os.path.join(directory, "pass-%d-%d.bin" % (manifest["generation"], len(shards)))
+        shards.append(write_shard(filename, records))
+    manifest["shards"] = shards
+    save_manifest(directory, manifest)
+    for shard in old:
+        os.remove(os.path.join(directory, shard[0]))
+
+def merge(directory, shard_size=1 << 24, fan_in=256):
+    # Joins every shard into shards of about shard_size entries, which never
+    # split the entries of a revive value, and counts collisions on the way
+    manifest = load_manifest(directory)
+    while len(manifest["shards"]) > fan_in:
+        merge_pass(directory, manifest, fan_in)
+
+    old = manifest["shards"]
+    records = heapq.merge(*[read_shard(directory, x) for x in old])
+
+    shards = []
+    stats = {"entries": 0, "values": 0, "colliding": 0, "max": 0}
+    buffer = []
+    last = None
+    count = 0
+    for revive, index in records:
+        if revive != last:
+            if count > 1:
+                stats["colliding"] += 1
+            stats["max"] = max(stats["max"], count)
+            stats["values"] += 1
+            count = 0
+            last = revive
+
+            if len(buffer) >= shard_size:
+                filename = os.path.join(directory, "merged-%d.bin.tmp" % len(shards))
+                shards.append(write_shard(filename, buffer))
+                buffer = []
+        buffer.append((revive, index))
+        count += 1
+        stats["entries"] += 1
+    if count > 1:
+        stats["colliding"] += 1
+    stats["max"] = max(stats["max"], count)
+    if buffer:
+        filename = os.path.join(directory, "merged-%d.bin.tmp" % len(shards))
+        shards.append(write_shard(filename, buffer))
+
+    # New shards may replace old ones with the same name
+    for shard in shards:
+        os.replace(os.path.join(directory, shard[0]),
+                os.path.join(directory, shard[0][:-len(".tmp")]))
+        shard[0] = shard[0][:-len(".tmp")]
+    for shard in old:
+        if shard[0] not in [x[0] for x in shards]:
+            os.remove(os.path.join(directory, shard[0]))
+
+    manifest["shards"] = shards
+    manifest["stats"] = stats
+    save_manifest(directory, manifest)
+    return stats
+
+class RevivalTable():
+    def __init__(self, directory, max_mapped=64):
+        self.directory = directory
+        self.manifest = load_manifest(directory)
+        self.ranges = get_ranges(self.manifest)
+        self.shards = self.manifest["shards"]
+
+        # Tables that weren't merged can have thousands of shards, so only the
+        # ones used last are kept mapped
+        self.views = LRUCache(max_mapped)
+
+    def get_view(self, shard):
+        view = self.views.get(shard[0])
+        if view is None:
+            view = map_shard(self.directory, shard)
+            self.views.put(shard[0], view)
+        return view
+
+    def find(self, revive):
+        # Candidate numbers with this revive value
+        for shard in self.shards:
+            name, count, first, last = shard
+            if revive < first or revive > last:
+                continue
+            view = self.get_view(shard)
+            low = 0
+            high = count
+            while low < high:
+                middle = (low + high) // 2
+                if view[middle * 2] < revive:
+                    low = middle + 1
+                else:
+                    high = middle
+            while low < count and view[low * 2] == revive:
+                yield view[low * 2 + 1]
+                low += 1
+
+    def lookup(self, revive):
+        return [search.get_candidate(self.ranges, None, x) for x in self.find(revive)]
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build a table of the revive values of every valid rescue password within the given ranges. Fields take either a value or an inclusive range like 1-99.")
+    for field in search.search_fields:
+        parser.add_argument("--" + field)
+    parser.add_argument("--team", action="append", help="team name to sweep, may be given multiple times")
+    parser.add_argument("-j", "--jobs", type=int)
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("-m", "--merge", action="store_true", help="merge the shards after sweeping")
+    parser.add_argument("--shard-size", type=int, default=1 << 24, help="entries per merged shard")
+    parser.add_argument("--fan-in", type=int, default=256, help="most shards merged at once")
+    parser.add_argument("-l", "--lookup", metavar="REVIVE", help="print the parameters of every rescue with this revive value, without sweeping")
+    parser.add_argument("directory")
+    args = parser.parse_args()
+
+    if args.lookup:
+        table = RevivalTable(args.directory)
+        matches = table.lookup(int(args.lookup, 0))
+        for info in matches:
+            info["team"] = password.decode_team(info["team"])
+            print(json.dumps(info))
+        if not matches:
+            exit(1)
+        exit(0)
+
+    ranges = []
+    teams = args.team or [""]
+    try:
+        for field, maxval in search.search_fields.items():
+            value = getattr(args, field)
+            if value is None:
+                value = "0" if field in ("unk1", "unk2") else "0-%d" % maxval
+            ranges.append((field, search.parse_range(value, maxval)))
+        for team in teams:
+            password.encode_team(team)
+    except ValueError as e:
+        print(e, file=stderr)
+        exit(1)
+
+    sweep(args.directory, ranges, teams, jobs=args.jobs, chunk_size=args.chunk_size)
+    if args.merge:
+        stats = merge(args.directory, shard_size=args.shard_size, fan_in=args.fan_in)
+        print("%d entries, %d revive values, %d with collisions, at most %d per value" % (
+                stats["entries"], stats["values"], stats["colliding"], stats["max"]),
+                file=stderr)
@@ -1,25 +1,175 @@
 import json
+import marshal
+import os
+import sys
+from types import MappingProxyType
 
-with open("data.json") as f:
-    romdata = json.load(f)
+path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data.json")
 
-charmap = romdata["charmap"]
-charmap_text = romdata["charmap_text"]
-crc32table = romdata["crc32table"]
+# Parsed copy of data.json, which is much faster to load
+snapshot_path = os.path.join(os.path.dirname(path), "__pycache__", "data.marshal")
+
+loaded = None
+
+class Entry():
+    __slots__ = ("name", "const", "valid")
+
+    # Keys of the entry in data.json
+    fields = ("const", "name", "valid")
+
+    def __init__(self, name="", const="", valid=False):
+        object.__setattr__(self, "name", sys.intern(name))
+        object.__setattr__(self, "const", sys.intern(const))
+        object.__setattr__(self, "valid", valid)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("romdata entries are read-only")
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, self.name)
+
+class Dungeon(Entry):
+    __slots__ = ("ascending", "floors")
+
+    fields = ("ascending", "const", "floors", "name", "valid")
+
+    def __init__(self, name="", const="", valid=False, ascending=False, floors=0):
+        super().__init__(name, const, valid)
+        object.__setattr__(self, "ascending", ascending)
+        object.__setattr__(self, "floors", floors)
+
+# Returned for any index past the end of a table
+invalid_entry = Entry()
+invalid_dungeon = Dungeon()
+invalid_index = MappingProxyType({
+    "const": "",
+    "name": "",
+    "valid": False
+})
+invalid_dungeon_index = MappingProxyType({
+    "ascending": False,
+    "const": "",
+    "floors": 0,
+    "name": "",
+    "valid": False
+})
+
+def freeze(data):
+    if isinstance(data, list):
+        return tuple(freeze(x) for x in data)
+    if isinstance(data, dict):
+        return {key: freeze(value) for key, value in data.items()}
+    return data
+
+def load_snapshot(key):
+    try:
+        with open(snapshot_path, "rb") as f:
+            snapshot_key, data = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if snapshot_key != key:
+        return None
+    return data
+
+def save_snapshot(key, data):
+    try:
+        os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+        with open(snapshot_path + ".tmp", "wb") as f:
+            marshal.dump((key, data), f)
+        os.replace(snapshot_path + ".tmp", snapshot_path)
+    except OSError:
+        # Not being able to write the snapshot only makes the next load slower
+        pass
+
+def make_tables(data):
+    tables = {}
+    valid = {}
+    for table in ("dungeons", "genders", "pokemon", "rewards"):
+        if table == "dungeons":
+            entries = tuple(Dungeon(**x) for x in data[table])
+        else:
+            entries = tuple(Entry(**x) for x in data[table])
+        tables[table] = entries
+
+        # Bit n is set if entry n is valid
+        bits = 0
+        for index, entry in enumerate(entries):
+            if entry.valid:
+                bits |= 1 << index
+        valid[table] = bits
+    return tables, valid
+
+def make_index(chars):
+    index = {}
+    for x, char in enumerate(chars):
+        index.setdefault(char, x)
+    return index
+
+def load():
+    global loaded, romdata, charmap, charmap_text, charmap_text_index, crc32table, tables, valid
+
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size, marshal.version)
+    if loaded == key:
+        return romdata
+
+    data = load_snapshot(key)
+    if data is None:
+        with open(path) as f:
+            data = freeze(json.load(f))
+        save_snapshot(key, data)
+
+    tables, valid = make_tables(data)
+
+    # The entries of the tables are only kept as records, see get_index()
+    romdata = {key: value for key, value in data.items() if key not in tables}
+    charmap = data["charmap"]
+    charmap_text = data["charmap_text"]
+    charmap_text_index = make_index(charmap_text)
+    crc32table = data["crc32table"]
+    loaded = key
+    return romdata
+
+state_names = ("romdata", "charmap", "charmap_text", "charmap_text_index", "crc32table", "tables", "valid")
+
+def __getattr__(name):
+    if name in state_names:
+        load()
+        return globals()[name]
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+def get_state():
+    # Everything set by load(), to go back to it with set_state()
+    if not loaded:
+        load()
+    return {name: globals()[name] for name in state_names + ("loaded",)}
+
+def set_state(state):
+    globals().update(state)
 
 def get_index(table, index):
-    if index >= len(romdata[table]):
+    # The entry as a mapping like in data.json, made from its record
+    if not loaded:
+        load()
+    entries = tables[table]
+    if index >= len(entries):
         if table == "dungeons":
-            return {
-                "ascending": False,
-                "const": "",
-                "floors": 0,
-                "name": "",
-                "valid": False
-            }
-        return {
-            "const": "",
-            "name": "",
-            "valid": False
-        }
-    return romdata[table][index]
+            return invalid_dungeon_index
+        return invalid_index
+    entry = entries[index]
+    return MappingProxyType({x: getattr(entry, x) for x in entry.fields})
+
+def get_entry(table, index):
+    if not loaded:
+        load()
+    entries = tables[table]
+    if index >= len(entries):
+        if table == "dungeons":
+            return invalid_dungeon
+        return invalid_entry
+    return entries[index]
+
+def is_valid(table, index):
+    if not loaded:
+        load()
+    return valid[table] >> index & 1 == 1
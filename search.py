@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+# Brute-force search for rescue passwords matching a set of constraints
+
+from sys import stderr, exit
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import json
+import os
+import time
+import password
+
+# The first fields vary the fastest while searching
+search_fields = {
+    "unk1": 1,
+    "unk2": 1,
+    "gender": 3,
+    "reward": 3,
+    "floor": 0x7F,
+    "dungeon": 0x7F,
+    "pokemon": 0x7FF,
+    "timestamp": 0xFFFFFFFF,
+}
+
+def parse_range(text, maxval):
+    start, sep, end = text.partition("-")
+    start = int(start, 0)
+    end = int(end, 0) if sep else start
+    if start < 0 or end > maxval or start > end:
+        raise ValueError("Invalid range: %s" % text)
+    return range(start, end + 1)
+
+def get_candidate(ranges, team, index):
+    info = {"type": 0, "team": team}
+    for field, values in ranges:
+        index, x = divmod(index, len(values))
+        info[field] = values[x]
+    return info
+
+def search_chunk(ranges, team, filters, start, end):
+    matches = []
+    for index in range(start, end):
+        info = get_candidate(ranges, team, index)
+        if password.get_warnings(info):
+            continue
+        code, info = password.encode(info, with_info=True)
+        if "revive" in filters and info["revive"] != filters["revive"]:
+            continue
+        text = password.format_password(code)
+        if "suffix" in filters and not text.endswith(filters["suffix"]):
+            continue
+        matches.append({"password": text, "info": info})
+    return matches
+
+def load_checkpoint(filename, key):
+    if not filename or not os.path.exists(filename):
+        return 0, []
+    with open(filename) as f:
+        checkpoint = json.load(f)
+    if checkpoint["key"] != key:
+        print("Checkpoint doesn't match the search parameters", file=stderr)
+        exit(1)
+    return checkpoint["next"], checkpoint["found"]
+
+def save_checkpoint(filename, key, next, found):
+    if not filename:
+        return
+    with open(filename + ".tmp", "w") as f:
+        json.dump({"key": key, "next": next, "found": found}, f)
+    os.replace(filename + ".tmp", filename)
+
+def search(ranges, team, filters, jobs=None, chunk_size=10000, limit=None,
+        checkpoint=None):
+    total = 1
+    for field, values in ranges:
+        total *= len(values)
+
+    key = json.dumps([[[f, v.start, v.stop] for f, v in ranges], team, filters])
+    next, found = load_checkpoint(checkpoint, key)
+    for match in found:
+        print(json.dumps(match))
+    seen = set(match["password"] for match in found)
+
+    chunks = iter(range(next, total, chunk_size))
+    completed = set()
+    searched = 0
+    start_time = time.monotonic()
+    report_time = start_time
+
+    if not jobs:
+        jobs = os.cpu_count()
+    executor = ProcessPoolExecutor(jobs)
+    pending = {}
+
+    def submit():
+        for start in chunks:
+            end = min(start + chunk_size, total)
+            future = executor.submit(search_chunk, ranges, team, filters, start, end)
+            pending[future] = (start, end)
+            if len(pending) >= jobs * 2:
+                break
+
+    try:
+        submit()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                start, end = pending.pop(future)
+                matches = future.result()
+                for match in matches:
+                    if limit and len(found) >= limit:
+                        break
+                    if match["password"] in seen:
+                        continue
+                    seen.add(match["password"])
+                    found.append(match)
+                    print(json.dumps(match), flush=True)
+                else:
+                    # Chunks cut short by the limit are searched again on resume
+                    completed.add(start)
+                searched += end - start
+
+            # Only checkpoint the part of the search space that's entirely done
+            while next in completed:
+                completed.remove(next)
+                next = min(next + chunk_size, total)
+
+            now = time.monotonic()
+            if now - report_time >= 1:
+                report_time = now
+                print("%d/%d candidates, %d/s, %d found" % (
+                        next, total, searched / (now - start_time), len(found)),
+                        file=stderr)
+                save_checkpoint(checkpoint, key, next, found)
+
+            if limit and len(found) >= limit:
+                break
+            submit()
+    except KeyboardInterrupt:
+        print("Interrupted", file=stderr)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        save_checkpoint(checkpoint, key, next, found)
+
+    elapsed = time.monotonic() - start_time
+    print("Searched %d candidates in %.2fs (%d/s), %d found" % (
+            searched, elapsed, searched / elapsed if elapsed else 0, len(found)),
+            file=stderr)
+    return found
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Search for valid rescue passwords. Fields take either a value or an inclusive range like 1-99.")
+    for field in search_fields:
+        parser.add_argument("--" + field)
+    parser.add_argument("--team", default="")
+    parser.add_argument("--revive", help="revive value the password must have")
+    parser.add_argument("--suffix", help="symbols the password must end with")
+    parser.add_argument("-n", "--count", type=int, help="stop after finding this many passwords")
+    parser.add_argument("-j", "--jobs", type=int)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("-c", "--checkpoint", help="file to save progress to, and resume from")
+    args = parser.parse_args()
+
+    ranges = []
+    try:
+        for field, maxval in search_fields.items():
+            value = getattr(args, field)
+            if value is None:
+                value = "0" if field in ("unk1", "unk2") else "0-%d" % maxval
+            ranges.append((field, parse_range(value, maxval)))
+    except ValueError as e:
+        print(e, file=stderr)
+        exit(1)
+
+    try:
+        team = password.encode_team(args.team)
+    except ValueError as e:
+        print(e, file=stderr)
+        exit(1)
+
+    filters = {}
+    if args.revive:
+        filters["revive"] = int(args.revive, 0)
+    if args.suffix:
+        filters["suffix"] = "".join(args.suffix.split()).upper()
+
+    found = search(ranges, team, filters, jobs=args.jobs, chunk_size=args.chunk_size,
+            limit=args.count, checkpoint=args.checkpoint)
+    if not found:
+        exit(1)
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+# Prefork server for the web app. The master process loads romdata, renders
+# the page once to fill the template and option caches, and then forks the
+# workers, which share all of that copy-on-write. When data.json changes, or
+# on SIGHUP, the master loads it again and replaces the workers one by one.
+# SIGUSR1 prints the memory used by every process.
+#
+#   ./server.py -w 32 -b 0.0.0.0:8000
+
+from sys import stderr, exit
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+import gc
+import os
+import signal
+import socket
+import time
+import traceback
+import password
+import romdata
+
+workers = int(os.environ.get("PASSWORD_WORKERS", os.cpu_count()))
+
+class RequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        if access_log:
+            super().log_message(format, *args)
+
+access_log = False
+
+def memory_usage(pid):
+    # Resident, proportional (shared pages split between the processes using
+    # them) and private memory in kB, or None where /proc isn't available
+    usage = {"rss": 0, "pss": 0, "private": 0}
+    try:
+        with open("/proc/%d/smaps_rollup" % pid) as f:
+            for line in f:
+                name, value = line.split()[:2]
+                if name == "Rss:":
+                    usage["rss"] += int(value)
+                elif name == "Pss:":
+                    usage["pss"] += int(value)
+                elif name in ("Private_Clean:", "Private_Dirty:"):
+                    usage["private"] += int(value)
+    except (OSError, ValueError):
+        return None
+    return usage
+
+def print_memory_usage(pids):
+    print("%8s %10s %10s %10s" % ("pid", "rss kB", "pss kB", "private kB"), file=stderr)
+    for pid in [os.getpid()] + sorted(pids):
+        usage = memory_usage(pid)
+        if usage:
+            print("%8d %10d %10d %10d" % (pid, usage["rss"], usage["pss"], usage["private"]), file=stderr)
+
+def refresh():
+    # Everything derived from romdata
+    password.reload_tables()
+    import app
+    app.revive_team = password.encode_team("Passwd tool")
+    return app
+
+def warm():
+    # Everything loaded here is shared with the workers forked afterwards
+    romdata.load()
+    app = refresh()
+    app.decode_cache.clear()
+    app.fragment_cache.clear()
+    app.encode_cache.clear()
+    client = app.app.test_client()
+    client.get("/")
+    for type in (0, 1):
+        info = {"type": type, "timestamp": 0, "unk1": 0, "team": [], "dungeon": 1,
+                "floor": 1, "pokemon": 1, "gender": 0, "reward": 0, "unk2": 0, "revive": 0}
+        client.get("/decode?c=" + password.format_password(password.encode(info)))
+    app.decode_cache.clear()
+    app.fragment_cache.clear()
+
+    # Keep the garbage collector from touching, and thereby copying, the
+    # objects that exist before forking
+    gc.collect()
+    gc.freeze()
+    return app.app
+
+def worker(sock, application):
+    server = WSGIServer(sock.getsockname(), RequestHandler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = sock
+    server.server_name = socket.getfqdn(sock.getsockname()[0])
+    server.server_port = sock.getsockname()[1]
+    server.setup_environ()
+    server.set_app(application)
+    server.timeout = 1
+
+    # Finish the request being handled before stopping
+    running = True
+
+    def stop(signum, frame):
+        nonlocal running
+        running = False
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, master_signals)
+    while running:
+        server.handle_request()
+    os._exit(0)
+
+master_signals = {signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGUSR1}
+
+def spawn(sock, application):
+    # Signals wait until the worker has replaced the master's handlers
+    signal.pthread_sigmask(signal.SIG_BLOCK, master_signals)
+    pid = os.fork()
+    if pid == 0:
+        try:
+            worker(sock, application)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            os._exit(1)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, master_signals)
+    return pid
+
+def serve(host, port, count, reload_interval=1):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+
+    # Every worker is woken up for a connection, the ones that don't get it
+    # have to go back to waiting instead of blocking in accept()
+    sock.setblocking(False)
+
+    start = time.monotonic()
+    application = warm()
+    print("Warmed up in %.2fs, starting %d workers on %s:%d" % (
+            time.monotonic() - start, count, host, port), file=stderr)
+
+    pids = set(spawn(sock, application) for x in range(count))
+    signals = []
+    for signum in master_signals:
+        signal.signal(signum, lambda signum, frame: signals.append(signum))
+
+    failed = None
+    while True:
+        # Replace any workers that died
+        while pids:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if not pid:
+                break
+            if pid in pids:
+                pids.remove(pid)
+                print("Worker %d exited, restarting it" % pid, file=stderr)
+                pids.add(spawn(sock, application))
+
+        reload = False
+        while signals:
+            signum = signals.pop()
+            if signum == signal.SIGHUP:
+                reload = True
+                continue
+            if signum == signal.SIGUSR1:
+                print_memory_usage(pids)
+                continue
+            print("Stopping", file=stderr)
+            for pid in pids:
+                os.kill(pid, signal.SIGTERM)
+            for pid in pids:
+                os.waitpid(pid, 0)
+            return
+
+        stat = os.stat(romdata.path)
+        key = (stat.st_mtime_ns, stat.st_size, romdata.loaded[2])
+        if key != romdata.loaded and key != failed:
+            reload = True
+
+        if reload:
+            print("Reloading", file=stderr)
+            gc.unfreeze()
+            state = romdata.get_state()
+            try:
+                application = warm()
+            except Exception:
+                # Don't try again until data.json changes again
+                failed = key
+                traceback.print_exc()
+                print("Reloading failed, keeping the old workers", file=stderr)
+
+                # Workers started later are forked from what the old ones were
+                romdata.set_state(state)
+                refresh()
+                gc.collect()
+                gc.freeze()
+            else:
+                # Replace the workers one at a time to keep serving meanwhile
+                for pid in list(pids):
+                    pids.add(spawn(sock, application))
+                    os.kill(pid, signal.SIGTERM)
+                    os.waitpid(pid, 0)
+                    pids.remove(pid)
+
+        time.sleep(reload_interval)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-w", "--workers", type=int, default=workers,
+            help="number of worker processes, PASSWORD_WORKERS or one per CPU by default")
+    parser.add_argument("-b", "--bind", default="127.0.0.1:8000", help="address and port to listen on")
+    parser.add_argument("--keystream-file",
+            help="precomputed keystream table to map before forking, generated if it doesn't exist")
+    parser.add_argument("--shared-tables", action="store_true",
+            help="keep the keystream table in memory shared by all workers, along with the CRC table if data.json needs the python CRC32 engine")
+    parser.add_argument("--access-log", action="store_true", help="log every request to stderr")
+    parser.add_argument("--reload-interval", type=float, default=1,
+            help="seconds between checks for changes to data.json")
+    args = parser.parse_args()
+
+    host, sep, port = args.bind.rpartition(":")
+    if not sep or not port.isdigit():
+        print("Invalid address: %s" % args.bind, file=stderr)
+        exit(1)
+    access_log = args.access_log
+
+    if args.shared_tables:
+        if not args.keystream_file:
+            print("Generating the keystream table, use --keystream-file to generate it only once", file=stderr)
+        password.share_tables(args.keystream_file)
+    elif args.keystream_file:
+        password.load_keystream_table(args.keystream_file)
+
+    serve(host.strip("[]") or "0.0.0.0", int(port), args.workers, args.reload_interval)